@@ -0,0 +1,71 @@
+"""
+Writing of cache files that several processes may update at the same time.
+
+Processes of a pool save their caches at exit, at about the same time.
+Each writer merges its entries into the file while holding a lock on it
+and writes to a temporary file of its own, which then replaces the cache file.
+"""
+
+import contextlib
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    #not available on Windows, writers aren't serialized there,
+    #but still don't overwrite each other's temporary files
+    fcntl = None
+
+
+@contextlib.contextmanager
+def locked(filename):
+    """
+    Hold an exclusive lock for updating a file, waiting for other processes holding it.
+
+    Parameter
+    ---------
+    filename : String
+        name of the file to update, the lock is taken on filename + ".lock"
+    """
+    directory = os.path.dirname(filename)
+    if directory != "" and not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok=True)
+
+    if fcntl is None:
+        yield
+        return
+
+    with open(filename + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def write_json(filename, content, **kwargs):
+    """
+    Replace a file with content written as JSON, so that readers never see a partly written file.
+
+    Parameters
+    ----------
+    filename : String
+        name of the file
+    content : object
+        object to write
+    kwargs
+        passed on to json.dump
+    """
+    directory = os.path.dirname(filename)
+    fd, tmp_filename = tempfile.mkstemp(dir=directory if directory != "" else ".",
+                                        prefix=os.path.basename(filename) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(content, tmp_file, **kwargs)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
@@ -0,0 +1,189 @@
+"""
+Progressive forms of verbs, used to turn verb phrases into gerunds.
+
+Looks verbs up in a lexicon, which starts with the forms in common_progressive
+and the forms stored in table_filename. Only verbs not in the lexicon are
+conjugated with pattern.en (imported on first use) or, if pattern.en is
+not installed, with spelling rules. New forms are added to the lexicon
+and written to table_filename at exit, merged with the forms other processes
+have written to it in the meantime.
+"""
+
+import atexit
+import json
+import os
+
+import cache_file
+
+
+table_filename = os.environ.get("RST_TO_QUD_CONJUGATION_TABLE",
+                                os.path.join(os.path.expanduser("~"), ".cache", "rst_to_qud", "progressive.json"))
+
+#set to False to neither read nor write table_filename
+persistent = True
+
+#set to False to conjugate unknown verbs with spelling rules only
+use_pattern = True
+
+common_progressive = {
+    "am" : "being",
+    "are" : "being",
+    "is" : "being",
+    "be" : "being",
+    "'m" : "being",
+    "'re" : "being",
+    "have" : "having",
+    "'ve" : "having",
+    "do" : "doing",
+    "go" : "going",
+    "see" : "seeing",
+    "agree" : "agreeing",
+    "disagree" : "disagreeing",
+    "lie" : "lying",
+    "die" : "dying",
+    "tie" : "tying",
+    "make" : "making",
+    "take" : "taking",
+    "give" : "giving",
+    "come" : "coming",
+    "get" : "getting",
+    "put" : "putting",
+    "let" : "letting",
+    "set" : "setting",
+    "run" : "running",
+    "begin" : "beginning",
+    "think" : "thinking",
+    "say" : "saying",
+    "know" : "knowing",
+    "want" : "wanting",
+    "need" : "needing",
+    "believe" : "believing",
+    "argue" : "arguing",
+    "use" : "using",
+    "pay" : "paying",
+    "cost" : "costing",
+    "help" : "helping",
+    "mean" : "meaning",
+    }
+
+_lexicon = None
+_changed = False
+_conjugate = None
+
+
+def _get_lexicon():
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = dict(common_progressive)
+        if persistent:
+            _lexicon.update(_load(table_filename))
+    return _lexicon
+
+
+def _load(filename):
+    """Read the forms stored in a file, none if it doesn't exist or can't be read."""
+    if not os.path.isfile(filename):
+        return dict()
+    try:
+        with open(filename) as table_file:
+            return json.load(table_file)
+    except ValueError:
+        #corrupt table, it will be overwritten at exit
+        return dict()
+
+
+def progressive(verb):
+    """
+    Return the progressive form of a verb.
+
+    Parameter
+    ---------
+    verb : String
+        verb in present tense
+
+    Return
+    ------
+    verb_progressive : String
+        progressive form, e.g. "making" for "make"
+    """
+    global _changed
+    lexicon = _get_lexicon()
+
+    if verb in lexicon:
+        return lexicon[verb]
+
+    verb_progressive = None
+    if use_pattern:
+        conjugate = _get_conjugate()
+        if not conjugate is None:
+            verb_progressive = conjugate(verb)
+    if verb_progressive is None:
+        verb_progressive = progressive_by_rules(verb)
+
+    lexicon[verb] = verb_progressive
+    _changed = True
+
+    return verb_progressive
+
+
+def _get_conjugate():
+    """Return a function conjugating a verb with pattern.en, None if pattern.en isn't installed."""
+    global _conjugate, use_pattern
+    if _conjugate is None:
+        try:
+            from pattern.en import conjugate, PROGRESSIVE
+        except ImportError:
+            use_pattern = False
+            return None
+        _conjugate = lambda verb : conjugate(verb, aspect=PROGRESSIVE)
+    return _conjugate
+
+
+def progressive_by_rules(verb):
+    """Build the progressive form of a regular verb from its spelling."""
+    vowels = "aeiou"
+
+    if verb.endswith("ie"):
+        return verb[:-2] + "ying"
+    if verb.endswith("ee") or verb.endswith("ye") or verb.endswith("oe"):
+        return verb + "ing"
+    if verb.endswith("e") and len(verb) > 2:
+        return verb[:-1] + "ing"
+
+    #double the final consonant of short verbs ending in consonant, vowel, consonant
+    num_vowel_groups = len([i for i, c in enumerate(verb) if c in vowels and (i == 0 or not verb[i-1] in vowels)])
+    if (len(verb) >= 3 and num_vowel_groups == 1
+        and not verb[-1] in vowels + "wxy"
+        and verb[-2] in vowels
+        and not verb[-3] in vowels):
+        return verb + verb[-1] + "ing"
+
+    return verb + "ing"
+
+
+def save(filename=None):
+    """Write the lexicon to a file, table_filename if filename is None."""
+    global _changed
+    if filename is None:
+        filename = table_filename
+
+    if not persistent or _lexicon is None:
+        return
+
+    learned = {verb : form for verb, form in _lexicon.items() if common_progressive.get(verb) != form}
+
+    with cache_file.locked(filename):
+        #forms written by other processes since this one loaded the table
+        merged = _load(filename)
+        merged.update(learned)
+        cache_file.write_json(filename, merged, indent=0, sort_keys=True)
+
+    _changed = False
+
+
+def _save_at_exit():
+    if _changed:
+        save()
+
+
+atexit.register(_save_at_exit)
@@ -1,7 +1,13 @@
 import argparse
+import time
 
+start_time = time.time()
+
+import lazy_import
 import test
 
+startup_time = time.time() - start_time
+
 """Module to call evaluate_transform from command line."""
 
 parser = argparse.ArgumentParser(description="Evaluate transform_rst on a corpus")
@@ -9,11 +15,21 @@ parser.add_argument('rst_path', help="Path of the folder of the RST trees.")
 parser.add_argument('gold_qud_path', help="Path of the folder containing the human-annotated QUD trees.")
 parser.add_argument('transformed_path', help="Path to write the transformed trees to.")
 parser.add_argument('result_filename', help="Path of the file to write the evaluation results to.")
+parser.add_argument('relations_filename', help="Path of the file to write the results for the relations to.")
+parser.add_argument('--jobs', type=int, default=1, help="Number of processes evaluating the RST trees in parallel.")
+parser.add_argument('--import-profile', action='store_true', help="Print the time spent on startup and on deferred imports.")
+
+#the processes started by --jobs import this module again, they must not run the evaluation
+if __name__ == "__main__":
+    args = parser.parse_args()
 
-args = parser.parse_args()
 
+    test.evaluate_transform(args.rst_path,
+                       args.gold_qud_path,
+                       args.transformed_path,
+                       args.result_filename,
+                       args.relations_filename,
+                       jobs=args.jobs)
 
-test.evaluate_transform(args.rst_path,
-                   args.gold_qud_path,
-                   args.transformed_path,
-                   args.result_filename)
+    if args.import_profile:
+        lazy_import.report(startup_time)
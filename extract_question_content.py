@@ -1,11 +1,95 @@
-from nltk.tokenize import sent_tokenize, word_tokenize
-import jpype
 import rst_tree
-from pattern.en import conjugate, PROGRESSIVE
+import collections as col
 import os
+import threading
 
+import conjugation
+import lazy_import
+import parse_cache
+import parse_server
+import parser_manager
+import rules_extractor
+import tregex_patterns
 
-def find_question_content(rst, gerund=True):
+#imported on first use, see lazy_import.py
+nltk = lazy_import.lazy_module("nltk")
+jpype = lazy_import.lazy_module("jpype")
+
+
+#budgets for a single parse, None for no limit
+#texts exceeding them are used as question content without parsing
+max_tokens = None
+max_parse_time = None
+
+#number of parsed texts and of fallbacks because of each budget
+metrics = col.Counter()
+
+#question contents of texts that weren't parsed because of a budget,
+#keyed by (cache model, max_tokens, max_parse_time, text);
+#kept out of the parse cache, since they depend on the budgets
+_fallbacks = dict()
+
+
+def set_budgets(tokens=None, parse_time=None):
+    """
+    Limit the effort spent on a single parse.
+
+    Parameters
+    ----------
+    tokens : int
+        maximum number of tokens of a text to be parsed, no limit if None
+    parse_time : float
+        maximum time in seconds for parsing a text, no limit if None
+    """
+    global max_tokens, max_parse_time
+    max_tokens = tokens
+    max_parse_time = parse_time
+
+
+#Parse_Pool that parse jobs are sent to, parsing happens in this process if None
+_pool = None
+
+
+def set_pool(pool):
+    """
+    Send parse jobs to a pool of parser processes.
+
+    Parameter
+    ---------
+    pool : Parse_Pool
+        pool to use, parse in this process again if None
+    """
+    global _pool
+    _pool = pool
+
+
+#address of a parse server to send parse jobs to, see parse_server.py
+_server_address = os.environ.get("RST_TO_QUD_PARSE_SERVER")
+
+
+def set_server(address):
+    """
+    Send parse jobs to a parse server, if it is running.
+
+    Parameter
+    ---------
+    address : String
+        address of the server, see parse_server.py,
+        don't use a server if None
+    """
+    global _server_address
+    _server_address = address
+
+
+def _use_pool(model):
+    if _pool is None:
+        return False
+    if model is None:
+        model = parser_manager.default_model
+    return _pool.model == model
+
+
+def find_question_content(rst, gerund=True, backend=None):
     """
     Extract the question content from the leaves of an rst tree, to use in a qud.
 
@@ -13,6 +97,10 @@ def find_question_content(rst, gerund=True):
     ---------
     rst : Rst_Node
         tree from which the phrase is to be extracted
+    gerund : Boolean
+        if True, turn the verb phrase into a gerund
+    backend : String
+        name of the extractor in backends to use, default_backend if None
     
     Return
     ------
@@ -22,14 +110,15 @@ def find_question_content(rst, gerund=True):
 
     if not rst.edu is None:
         text = rst.edu
-        question_content_list = extract_from_text(text, gerund=gerund)
+        extract, _, _ = get_backend(backend)
+        question_content_list = extract(text, gerund=gerund)
         question_content = " ".join(question_content_list)
         question_content = strip_content(question_content)
         return question_content
 
     if len(rst.children[0]) > 1:
         #multinuc
-        #text = _find_text(rst.children[0])
+        #text = rst.get_text()
         #question_content_list = extract_from_text(text, single=False)
         #question_content = " ".join(question_content_list)
         return "that"
@@ -38,47 +127,467 @@ def find_question_content(rst, gerund=True):
         raise Error("RST node is neither EDU nor does it have children.")
 
     #span
-    question_content = find_question_content(rst.children[0][0])
+    question_content = find_question_content(rst.children[0][0], backend=backend)
 
     return question_content
 
 
+def resolve_span(rst):
+    """
+    Follow span nodes down to the node their question content is extracted from.
+
+    Parameter
+    ---------
+    rst : Rst_Node
+        tree from which the phrase is to be extracted
+
+    Return
+    ------
+    node : Rst_Node
+        rst itself if it is an EDU or a multinuclear node, otherwise the EDU or
+        multinuclear node below the nuclei of the spans
+    """
+    while rst.edu is None and len(rst.children[0]) == 1:
+        rst = rst.children[0][0]
+
+    return rst
+
+
+def find_question_contents(rst, backend=None):
+    """
+    Extract both variants of the question content from the leaves of an rst tree.
+
+    Gives the same results as calling find_question_content with gerund=True and gerund=False,
+    but extracts the question content of an EDU only once if the backend has an extract_both function.
+
+    Parameter
+    ---------
+    rst : Rst_Node
+        tree from which the phrase is to be extracted
+    backend : String
+        name of the extractor in backends to use, default_backend if None
+
+    Returns
+    -------
+    gerund_content : String
+        extracted phrase with the verb phrase turned into a gerund
+    plain_content : String
+        extracted phrase without changes to the verb phrase
+    """
+
+    node = resolve_span(rst)
+
+    if node.edu is None:
+        #multinuc, or a node without children that find_question_content rejects
+        gerund_content = find_question_content(node, backend=backend)
+        return gerund_content, gerund_content
+
+    extract, _, extract_both = get_backend(backend)
+    if extract_both is None:
+        gerund_words = extract(node.edu, gerund=True)
+        plain_words = extract(node.edu, gerund=False)
+    else:
+        gerund_words, plain_words = extract_both(node.edu)
+
+    gerund_content = strip_content(" ".join(gerund_words))
+    if not node is rst:
+        #span, find_question_content uses the gerund variant of the nucleus for both
+        return gerund_content, gerund_content
+
+    return gerund_content, strip_content(" ".join(plain_words))
+
+
 def strip_content(text):
     text = text.strip("., ")
     text = text[0].lower() + text[1:]
     return text
 
 
-def extract_from_text(text, gerund=True):
+def extract_from_text(text, gerund=True, model=None):
+    """
+    Parse text and extract the question content from it.
 
-    classpath = os.environ['CLASSPATH']
-    if classpath is None:
-        raise Error("Java classpath not set")
-    if not jpype.isJVMStarted():
-        jpype.startJVM(jpype.getDefaultJVMPath(), "-Djava.class.path=%s" % classpath)
+    Parameters
+    ----------
+    text : String
+        text to parse
+    gerund : Boolean
+        if True, turn the verb phrase into a gerund
+    model : String
+        parser model to use, parser_manager.default_model if None
 
-    
-    words = word_tokenize(text)
+    Return
+    ------
+    question_content : [String]
+        words of the extracted phrase
+    """
+    return extract_from_texts([text], gerund=gerund, model=model)[0]
+
+
+def extract_both_from_text(text, model=None):
+    """
+    Parse text and extract both variants of the question content from it.
+
+    Parameters
+    ----------
+    text : String
+        text to parse
+    model : String
+        parser model to use, parser_manager.default_model if None
+
+    Returns
+    -------
+    gerund_words : [String]
+        words of the extracted phrase with the verb phrase turned into a gerund
+    plain_words : [String]
+        words of the extracted phrase without changes to the verb phrase
+    """
+    return extract_both_from_texts([text], model=model)[0]
+
+
+def get_cache_model(model=None):
+    """
+    Return the identifier under which extractions with a model are cached.
+
+    It includes the parser version and the extraction patterns,
+    since both change the extracted phrases.
+    """
+    if model is None:
+        model = parser_manager.default_model
+
+    patterns = " | ".join(tregex_patterns.extraction_patterns)
+
+    return model + "@" + parser_manager.PARSER_VERSION + ":" + patterns
+
+
+def to_word_list(words):
+    """Convert a list of tokens to a Java list of Words in a single call into the JVM."""
+    SentenceUtils = jpype.JPackage("edu").stanford.nlp.ling.SentenceUtils
+    return SentenceUtils.toWordList(jpype.JArray(jpype.JString)(words))
+
+
+def extract_from_texts(texts, gerund=True, model=None):
+    """
+    Parse several texts at once and extract the question content from each of them.
+
+    See extract_both_from_texts.
+
+    Parameters
+    ----------
+    texts : [String]
+        texts to parse
+    gerund : Boolean
+        if True, turn the verb phrases into gerunds
+    model : String
+        parser model to use, parser_manager.default_model if None
+
+    Return
+    ------
+    question_contents : [[String]]
+        words of the extracted phrases, in the same order as texts
+    """
+    variant = 0 if gerund else 1
+    return [list(contents[variant]) for contents in extract_both_from_texts(texts, model=model)]
+
+
+def extract_both_from_texts(texts, model=None):
+    """
+    Parse several texts at once and extract both variants of the question content from each of them.
+
+    Texts that are not in the parse cache are sent to the parse server or the parser pool,
+    if there is one, or are parsed in this process.
+    Both variants of the question content are cached for them. Texts that exceeded a budget
+    are remembered for this process only, together with the budgets.
+
+    Parameters
+    ----------
+    texts : [String]
+        texts to parse
+    model : String
+        parser model to use, parser_manager.default_model if None
+
+    Return
+    ------
+    question_contents : [([String], [String])]
+        for each text the words of the question content with and without gerund,
+        in the same order as texts
+    """
+
+    cache_model = get_cache_model(model)
+
+    question_contents = [None] * len(texts)
+    for i, text in enumerate(texts):
+        gerund_words = parse_cache.get(text, True, cache_model)
+        plain_words = parse_cache.get(text, False, cache_model)
+        if not gerund_words is None and not plain_words is None:
+            question_contents[i] = (gerund_words, plain_words)
+        else:
+            question_contents[i] = _fallbacks.get((cache_model, max_tokens, max_parse_time, text))
+
+    missing = []
+    seen = set()
+    for text, question_content in zip(texts, question_contents):
+        if question_content is None and not text in seen:
+            missing.append(text)
+            seen.add(text)
+
+    if missing == []:
+        return question_contents
+
+    if model is None:
+        model = parser_manager.default_model
+
+    results = None
+    if not _server_address is None:
+        #None if the server isn't running
+        results = parse_server.request(missing, _server_address, model=model,
+                                       max_tokens=max_tokens, max_parse_time=max_parse_time)
+    if results is None and _use_pool(model):
+        results = _pool.extract(missing, max_tokens=max_tokens, max_parse_time=max_parse_time)
+    if results is None:
+        results = extract_variants(missing, model=model)
+
+    extracted = dict()
+    for text, (gerund_words, plain_words, fallback) in zip(missing, results):
+        if fallback is None:
+            metrics["parsed"] += 1
+            parse_cache.put(text, True, gerund_words, cache_model)
+            parse_cache.put(text, False, plain_words, cache_model)
+        else:
+            #counted once per text, later requests are answered from _fallbacks
+            metrics["fallback_" + fallback] += 1
+            _fallbacks[(cache_model, max_tokens, max_parse_time, text)] = (gerund_words, plain_words)
+        extracted[text] = (gerund_words, plain_words)
+
+    for i, text in enumerate(texts):
+        if question_contents[i] is None:
+            question_contents[i] = extracted[text]
+
+    return question_contents
+
+
+def extract_variants(texts, model=None):
+    """
+    Parse texts in this process and extract both variants of the question content.
+
+    Texts longer than max_tokens and texts whose parse takes longer than max_parse_time
+    aren't parsed, their words are used as question content instead.
+    Without a time budget, all texts are handed to the parser in a single call.
 
-    text_list = jpype.java.util.ArrayList()
-    for word in words:
-        Word = jpype.JPackage("edu").stanford.nlp.ling.Word(word)
-        Word.setWord(word)
-        text_list.add(Word)
+    Parameters
+    ----------
+    texts : [String]
+        texts to parse
+    model : String
+        parser model to use, parser_manager.default_model if None
 
-    StanfordParser = jpype.JPackage("edu").stanford.nlp.parser.lexparser.LexicalizedParser.loadModel("edu/stanford/nlp/models/lexparser/englishPCFG.ser.gz")
-    tree = StanfordParser.parse(text_list)
+    Return
+    ------
+    question_contents : [([String], [String], String)]
+        for each text the words of the question content with and without gerund,
+        and the budget that was exceeded ("tokens" or "time"), None if the text was parsed
+    """
+    token_lists = [nltk.word_tokenize(text) for text in texts]
+
+    results = [None] * len(texts)
+
+    to_parse = []
+    for i, words in enumerate(token_lists):
+        if not max_tokens is None and len(words) > max_tokens:
+            results[i] = (list(words), list(words), "tokens")
+        else:
+            to_parse.append(i)
+
+    if to_parse == []:
+        return results
+
+    StanfordParser = parser_manager.get_parser(model)
+
+    if max_parse_time is None:
+        sentences = jpype.java.util.ArrayList()
+        for i in to_parse:
+            sentences.add(to_word_list(token_lists[i]))
+        trees = StanfordParser.parseMultiple(sentences)
+    else:
+        trees = [parse_with_time_budget(StanfordParser, token_lists[i], max_parse_time) for i in to_parse]
+
+    for i, tree in zip(to_parse, trees):
+        if tree is None:
+            words = token_lists[i]
+            results[i] = (list(words), list(words), "time")
+        else:
+            results[i] = (extract_from_single(tree, gerund=True), extract_from_single(tree, gerund=False), None)
+
+    return results
+
+
+def parse_with_time_budget(parser, words, max_time):
+    """
+    Parse words, giving up after max_time seconds.
+
+    The parse runs in a separate thread, which is interrupted if it takes too long.
+
+    Parameters
+    ----------
+    parser : LexicalizedParser
+        parser to use
+    words : [String]
+        tokens to parse
+    max_time : float
+        time budget in seconds
+
+    Return
+    ------
+    tree : Tree
+        parse tree, None if the parse took too long
+    """
+    word_list = to_word_list(words)
+    outcome = dict()
 
-    return extract_from_single(tree, gerund=gerund)
+    def parse():
+        if not jpype.isThreadAttachedToJVM():
+            jpype.attachThreadToJVM()
+        outcome["thread"] = jpype.java.lang.Thread.currentThread()
+        try:
+            outcome["tree"] = parser.parse(word_list)
+        except Exception as ex:
+            outcome["error"] = ex
+
+    thread = threading.Thread(target=parse)
+    thread.daemon = True
+    thread.start()
+    thread.join(max_time)
+
+    if thread.is_alive():
+        #the parser checks for interrupts, so this stops it soon
+        if "thread" in outcome:
+            outcome["thread"].interrupt()
+        return None
+
+    if "error" in outcome:
+        raise outcome["error"]
+
+    return outcome["tree"]
+
+
+def collect_edus(rst):
+    """
+    Collect the EDUs of an rst tree in the order they appear in the text.
+
+    Parameter
+    ---------
+    rst : Rst_Node
+        tree from which to collect the EDUs
+
+    Return
+    ------
+    edus : [String]
+        texts of the EDUs
+    """
+    edus = []
+    stack = [rst]
+
+    while stack != []:
+        node = stack.pop()
+
+        if not node.edu is None:
+            edus.append(node.edu)
+
+        #push in reverse order, so that the leftmost subtree is visited first
+        subtrees = [sat for sat, _ in node.get_satellites(rst_tree.SIDE_LEFT)]
+        subtrees += node.children[0]
+        subtrees += [sat for sat, _ in node.get_satellites(rst_tree.SIDE_RIGHT)]
+        stack += reversed(subtrees)
+
+    return edus
+
+
+def prefetch(rst_trees, backend=None):
+    """
+    Parse all EDUs of one or more rst trees in a single pass,
+    so that later calls of find_question_content are answered from the parse cache.
+
+    Parameters
+    ----------
+    rst_trees : Rst_Node, Rst_Forest_Node or a list of them
+        tree or corpus of trees whose EDUs are to be parsed
+    backend : String
+        name of the extractor in backends to use, default_backend if None
+    """
+    _, extract_many, _ = get_backend(backend)
+    if extract_many is None:
+        #nothing to gain from parsing ahead of time
+        return
+
+    #a single tree, an Rst_Node or a view of a tree in an Rst_Forest
+    if hasattr(rst_trees, "children"):
+        rst_trees = [rst_trees]
+
+    texts = []
+    for tree in rst_trees:
+        texts += collect_edus(tree)
+
+    extract_many(texts)
+
+
+#extractors that can be used by find_question_content
+#maps names to triples of a function extracting the question content from a single text,
+#a function parsing many texts ahead of time (None if that isn't worth it)
+#and a function extracting both variants from a single text (None if extract is called twice)
+backends = dict()
+
+default_backend = "stanford"
+
+
+def register_backend(name, extract, extract_many=None, extract_both=None):
+    """
+    Make an extractor available to find_question_content.
+
+    Parameters
+    ----------
+    name : String
+        name of the extractor
+    extract : function
+        function taking a text and the keyword argument gerund and
+        returning the words of the question content
+    extract_many : function
+        function taking a list of texts that prepares the answers of extract,
+        None if the extractor doesn't profit from batches
+    extract_both : function
+        function taking a text and returning the words of the question content
+        with and without gerund, None to call extract for each variant
+    """
+    backends[name] = (extract, extract_many, extract_both)
+
+
+def set_default_backend(name):
+    """Set the extractor used by find_question_content when no backend is given."""
+    global default_backend
+    if not name in backends:
+        raise ValueError("Unknown question content extractor: " + str(name))
+    default_backend = name
+
+
+def get_backend(name=None):
+    """Return the functions of an extractor, those of default_backend if name is None."""
+    if name is None:
+        name = default_backend
+    if not name in backends:
+        raise ValueError("Unknown question content extractor: " + str(name))
+    return backends[name]
+
+
+register_backend("stanford", extract_from_text, extract_both_from_texts, extract_both_from_text)
+register_backend("rules", rules_extractor.extract_from_text, extract_both=rules_extractor.extract_both_from_text)
 
 
 def extract_from_single(tree, gerund=True):
-    pattern_string = "NP=nounp .. VP=verbp"
-    TregexPattern = jpype.JPackage("edu").stanford.nlp.trees.tregex.TregexPattern
-    pattern = TregexPattern.compile(pattern_string)
-    matcher = pattern.matcher(tree)
+    for pattern in tregex_patterns.get_extraction_patterns():
+        matcher = pattern.matcher(tree)
+
+        if not matcher.find():
+            continue
 
-    if matcher.find():
         np_tree = matcher.getNode("nounp")
         vp_tree = matcher.getNode("verbp")
 
@@ -97,8 +606,7 @@ def extract_from_single(tree, gerund=True):
 
         
 def extract_subject(trees):
-    TregexPattern = jpype.JPackage("edu").stanford.nlp.trees.tregex.TregexPattern
-    pattern = TregexPattern.compile("NP")
+    pattern = tregex_patterns.get_pattern(tregex_patterns.SUBJECT_PATTERN)
 
     for tree in trees:
         matcher = pattern.matcher(tree)
@@ -125,7 +633,7 @@ def ingify(tree):
 
     verb = str(children[0].getChildrenAsList()[0].label())
 
-    verb_progressive = conjugate(verb, aspect=PROGRESSIVE)
+    verb_progressive = conjugation.progressive(verb)
 
     leaves = tree.getLeaves()
     words = list(map(str, leaves))
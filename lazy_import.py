@@ -0,0 +1,97 @@
+"""
+Deferred imports of heavy dependencies.
+
+nltk and jpype take a noticeable time to import. Modules that only need them
+for parsing import them through lazy_module, so that reading, printing and
+evaluating trees starts quickly. The time spent on each deferred import is
+recorded in import_times and can be printed with report.
+"""
+
+import collections as col
+import importlib
+import sys
+import time
+
+
+#seconds spent importing each deferred module, in the order they were imported
+import_times = col.OrderedDict()
+
+
+class Lazy_Module:
+    """
+    Stand-in for a module that is imported on first attribute access.
+
+    Attributes
+    ----------
+    name : String
+        name of the module
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = timed_import(self.name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        #only called for attributes not found on the stand-in itself
+        if attribute.startswith("__") or attribute in ("name", "_module"):
+            raise AttributeError(attribute)
+        return getattr(self._load(), attribute)
+
+    def is_loaded(self):
+        """Check if the module has been imported."""
+        return not self._module is None
+
+
+def lazy_module(name):
+    """
+    Return a stand-in for a module, which imports the module on first use.
+
+    Parameter
+    ---------
+    name : String
+        name of the module, e.g. "nltk.tokenize"
+
+    Return
+    ------
+    module : Lazy_Module
+        stand-in for the module
+    """
+    return Lazy_Module(name)
+
+
+def timed_import(name):
+    """Import a module and record how long that took, if it wasn't imported before."""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    start = time.time()
+    module = importlib.import_module(name)
+    import_times[name] = time.time() - start
+
+    return module
+
+
+def report(startup_time=None, out=None):
+    """
+    Print the time spent on deferred imports.
+
+    Parameters
+    ----------
+    startup_time : float
+        time in seconds the program took to start, printed first if given
+    out : file
+        file to write the report to, sys.stderr if None
+    """
+    if out is None:
+        out = sys.stderr
+
+    if not startup_time is None:
+        out.write("startup | " + "%.3f" % startup_time + " s\n")
+
+    for name, seconds in import_times.items():
+        out.write("import " + name + " | " + "%.3f" % seconds + " s\n")
@@ -0,0 +1,233 @@
+"""
+Persistent cache for question contents extracted from EDUs.
+
+Entries are keyed by a hash of the normalized EDU text and the parser model,
+and hold the extracted word lists with and without gerund.
+The cache is kept in memory and evicts the least recently used entries when it
+grows beyond max_entries. Unless persistent is False, it is read from and
+written to cache_filename, so that a repeated run doesn't need to start
+the JVM for EDUs it has seen before. Saving merges the entries with those
+other processes have written to the file in the meantime.
+"""
+
+import atexit
+import collections as col
+import hashlib
+import json
+import os
+
+import cache_file
+
+
+cache_filename = os.environ.get("RST_TO_QUD_PARSE_CACHE",
+                                os.path.join(os.path.expanduser("~"), ".cache", "rst_to_qud", "parse_cache.json"))
+
+max_entries = 100000
+
+#set to False to neither read nor write the cache file
+persistent = True
+
+_entries = None
+_changed = False
+#models passed to invalidate since the cache was loaded, also removed from the file when saving
+_invalidated = []
+
+
+def normalize(text):
+    """Normalize whitespace in an EDU text."""
+    return " ".join(text.split())
+
+
+def make_key(text, model):
+    """
+    Return the cache key for an EDU text parsed with a certain model.
+
+    Parameters
+    ----------
+    text : String
+        EDU text
+    model : String
+        identifier of the parser model and extraction rules used
+
+    Return
+    ------
+    key : String
+        hex digest identifying text and model
+    """
+    content = model + "\n" + normalize(text)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def _variant(gerund):
+    if gerund:
+        return "gerund"
+    return "plain"
+
+
+def _get_entries():
+    global _entries
+    if _entries is None:
+        if persistent:
+            _entries = load(cache_filename)
+        else:
+            _entries = col.OrderedDict()
+    return _entries
+
+
+def load(filename):
+    """
+    Read cache entries from a file.
+
+    Parameter
+    ---------
+    filename : String
+        name of the cache file
+
+    Return
+    ------
+    entries : OrderedDict
+        cache entries from least to most recently used,
+        empty if the file doesn't exist or can't be read
+    """
+    if not os.path.isfile(filename):
+        return col.OrderedDict()
+
+    try:
+        with open(filename) as entries_file:
+            entries = json.load(entries_file, object_pairs_hook=col.OrderedDict)
+    except ValueError:
+        #corrupt cache file, start over
+        return col.OrderedDict()
+
+    return entries
+
+
+def save(filename=None):
+    """Write the cache to a file, cache_filename if filename is None."""
+    global _changed
+    if filename is None:
+        filename = cache_filename
+
+    if not persistent or _entries is None:
+        return
+
+    with cache_file.locked(filename):
+        #entries written by other processes since this one loaded the file
+        merged = load(filename)
+        for model in _invalidated:
+            _remove_entries(merged, model)
+
+        #entries of this process are the more recently used ones
+        for key, entry in _entries.items():
+            if key in merged:
+                del merged[key]
+            merged[key] = entry
+
+        while len(merged) > max_entries:
+            merged.popitem(last=False)
+
+        cache_file.write_json(filename, merged)
+
+    _changed = False
+
+
+def get(text, gerund, model):
+    """
+    Look up the question content of an EDU.
+
+    Parameters
+    ----------
+    text : String
+        EDU text
+    gerund : Boolean
+        which variant of the question content to return
+    model : String
+        identifier of the parser model and extraction rules used
+
+    Return
+    ------
+    words : [String]
+        cached words of the question content, None if not in cache
+    """
+    entries = _get_entries()
+    key = make_key(text, model)
+
+    if not key in entries:
+        return None
+
+    entry = entries[key]
+    words = entry.get(_variant(gerund))
+    if words is None:
+        return None
+
+    entries.move_to_end(key)
+
+    return list(words)
+
+
+def put(text, gerund, words, model):
+    """
+    Store the question content of an EDU.
+
+    Parameters
+    ----------
+    text : String
+        EDU text
+    gerund : Boolean
+        which variant of the question content words is
+    words : [String]
+        words of the question content
+    model : String
+        identifier of the parser model and extraction rules used
+    """
+    global _changed
+    entries = _get_entries()
+    key = make_key(text, model)
+
+    if key in entries:
+        entries.move_to_end(key)
+    else:
+        entries[key] = {"model": model}
+
+    entries[key][_variant(gerund)] = list(words)
+    _changed = True
+
+    while len(entries) > max_entries:
+        entries.popitem(last=False)
+
+
+def invalidate(model=None):
+    """
+    Remove entries from the cache.
+
+    Parameter
+    ---------
+    model : String
+        only remove entries for this parser model, remove all entries if None;
+        either the model as passed to the parser (e.g. parser_manager.default_model),
+        which removes its entries for all parser versions and extraction patterns,
+        or a full identifier from extract_question_content.get_cache_model
+    """
+    global _changed
+    _remove_entries(_get_entries(), model)
+    _invalidated.append(model)
+    _changed = True
+
+
+def _remove_entries(entries, model):
+    if model is None:
+        entries.clear()
+    else:
+        #identifiers are model + "@" + parser version + ":" + patterns
+        prefix = model + "@"
+        for key in [key for key, entry in entries.items()
+                    if entry["model"] == model or entry["model"].startswith(prefix)]:
+            del entries[key]
+
+
+def _save_at_exit():
+    if _changed:
+        save()
+
+
+atexit.register(_save_at_exit)
@@ -0,0 +1,266 @@
+"""
+Pool of parser processes.
+
+jpype allows only one JVM per process and the parser runs on a single thread,
+so the pool starts several worker processes, each with its own JVM and parser.
+Texts are sent to the workers in chunks. Workers that die, e.g. because
+their JVM crashed, are restarted and their chunk is sent out again.
+"""
+
+import multiprocessing as mp
+from multiprocessing.connection import wait
+import time
+
+
+def _worker_main(conn, model):
+    """
+    Main loop of a worker process.
+
+    Parameters
+    ----------
+    conn : Connection
+        connection to the pool
+    model : String
+        parser model to load
+    """
+    import extract_question_content as eqc
+    import parser_manager
+    import tregex_patterns
+
+    parser_manager.get_parser(model)
+    tregex_patterns.compile_all()
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+
+        kind = message[0]
+
+        if kind == "stop":
+            return
+        elif kind == "ping":
+            conn.send(("pong", parser_manager.is_loaded(model)))
+        elif kind == "extract":
+            texts, budgets = message[1], message[2]
+            try:
+                eqc.set_budgets(*budgets)
+                conn.send(("result", eqc.extract_variants(texts, model=model)))
+            except Exception as ex:
+                conn.send(("error", str(ex)))
+
+
+class Parse_Pool:
+    """
+    Class representing a pool of parser processes.
+
+    Attributes
+    ----------
+    processes : int
+        number of worker processes
+    model : String
+        parser model loaded by the workers
+    chunksize : int
+        number of texts sent to a worker at once
+    max_restarts : int
+        how often a chunk is sent out again after the worker it was sent to died
+    """
+
+    def __init__(self, processes=None, model=None, chunksize=16, max_restarts=2):
+        import parser_manager
+
+        if processes is None:
+            processes = mp.cpu_count()
+        if model is None:
+            model = parser_manager.default_model
+
+        self.processes = processes
+        self.model = model
+        self.chunksize = chunksize
+        self.max_restarts = max_restarts
+
+        self._context = mp.get_context("spawn")
+        self._workers = [self._start_worker() for _ in range(processes)]
+
+    def _start_worker(self):
+        """Start a worker process and return it with the pool's end of its connection."""
+        conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn, self.model))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+
+        return [process, conn]
+
+    def _restart_worker(self, index):
+        process, conn = self._workers[index]
+        conn.close()
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+        self._workers[index] = self._start_worker()
+
+    def health_check(self, timeout=60):
+        """
+        Ping all workers and restart those that are dead or don't answer in time.
+
+        Parameter
+        ---------
+        timeout : float
+            seconds to wait for an answer,
+            should cover JVM startup and model loading of fresh workers
+
+        Return
+        ------
+        restarted : int
+            number of restarted workers
+        """
+        restarted = 0
+
+        for index, (process, conn) in enumerate(self._workers):
+            healthy = False
+            try:
+                if process.is_alive():
+                    conn.send(("ping",))
+                    if conn.poll(timeout):
+                        answer = conn.recv()
+                        healthy = answer == ("pong", True)
+            except (EOFError, OSError):
+                healthy = False
+
+            if not healthy:
+                self._restart_worker(index)
+                restarted += 1
+
+        return restarted
+
+    def extract(self, texts, max_tokens=None, max_parse_time=None):
+        """
+        Extract the question contents of texts on the workers.
+
+        Parameters
+        ----------
+        texts : [String]
+            texts to parse
+        max_tokens : int
+            maximum number of tokens of a text to be parsed, no limit if None
+        max_parse_time : float
+            maximum time in seconds for parsing a text, no limit if None
+
+        Return
+        ------
+        question_contents : [([String], [String], String)]
+            for each text the words of the question content with and without gerund
+            and the exceeded budget, see extract_question_content.extract_variants,
+            in the same order as texts
+        """
+        if self._workers == []:
+            raise ValueError("Parse pool is closed")
+
+        budgets = (max_tokens, max_parse_time)
+        chunks = [(i, texts[i:i+self.chunksize]) for i in range(0, len(texts), self.chunksize)]
+        chunks.reverse()
+
+        results = [None] * len(texts)
+        errors = []
+        restarts = dict()
+        #index of worker -> chunk it is working on
+        busy = dict()
+
+        while chunks != [] or busy != {}:
+            for index in range(len(self._workers)):
+                #a worker that died while idle is restarted and gets the chunk again,
+                #until the chunk has used up its restarts
+                while chunks != [] and not index in busy:
+                    chunk = chunks.pop()
+                    try:
+                        self._workers[index][1].send(("extract", chunk[1], budgets))
+                        busy[index] = chunk
+                    except OSError:
+                        self._restart_worker(index)
+                        if self._may_retry(chunk, restarts, errors):
+                            chunks.append(chunk)
+
+            if busy == {}:
+                #every remaining chunk used up its restarts
+                continue
+
+            waiting = dict()
+            for index in busy.keys():
+                process, conn = self._workers[index]
+                waiting[conn] = index
+                waiting[process.sentinel] = index
+
+            for ready in wait(list(waiting.keys())):
+                index = waiting[ready]
+                if not index in busy:
+                    #connection and sentinel of the same worker were both ready
+                    continue
+                chunk = busy[index]
+                process, conn = self._workers[index]
+
+                try:
+                    answer = conn.recv()
+                except (EOFError, OSError):
+                    answer = None
+
+                if answer is None:
+                    #worker died, restart it and send the chunk out again
+                    del busy[index]
+                    self._restart_worker(index)
+                    if self._may_retry(chunk, restarts, errors):
+                        chunks.append(chunk)
+                    continue
+
+                del busy[index]
+                kind, content = answer
+                if kind == "error":
+                    #keep collecting, so that no answers are left in the connections
+                    errors.append(content)
+                    continue
+
+                start = chunk[0]
+                results[start:start+len(content)] = content
+
+        if errors != []:
+            raise Exception(errors[0])
+
+        return results
+
+    def _may_retry(self, chunk, restarts, errors):
+        """Count a restart for chunk and check if it may be sent out again, otherwise record an error."""
+        restarts[chunk[0]] = restarts.get(chunk[0], 0) + 1
+        if restarts[chunk[0]] > self.max_restarts:
+            errors.append("Parser worker died repeatedly on texts starting at position " + str(chunk[0]))
+            return False
+        return True
+
+    def close(self, timeout=10):
+        """Stop all workers, and stop sending parse jobs to this pool if it was set with set_pool."""
+        import extract_question_content as eqc
+
+        if eqc._pool is self:
+            eqc.set_pool(None)
+
+        for process, conn in self._workers:
+            try:
+                conn.send(("stop",))
+            except OSError:
+                pass
+
+        deadline = time.time() + timeout
+        for process, conn in self._workers:
+            process.join(max(0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
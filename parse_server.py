@@ -0,0 +1,249 @@
+"""
+Parse server keeping a warm JVM, parser and Tregex patterns between runs.
+
+Run it with
+    python parse_server.py [--address ADDRESS] [--model MODEL]
+and set RST_TO_QUD_PARSE_SERVER to the same address (or call
+extract_question_content.set_server) to have extract_question_content send
+its parse jobs to the server. If the server isn't running, parsing falls back
+to the calling process.
+
+Addresses are either paths of Unix domain sockets ("unix:/tmp/parse.sock"
+or just "/tmp/parse.sock") or "host:port" for TCP.
+
+Requests and answers are JSON objects, one per line:
+    {"texts": [...], "model": ..., "max_tokens": ..., "max_parse_time": ...}
+        ->  {"results": [[gerund_words, plain_words, exceeded_budget], ...]}
+    {"ping": true}                  ->  {"pong": true}
+Failed requests are answered with {"error": message}.
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+
+
+DEFAULT_ADDRESS = "unix:" + os.path.join(os.path.expanduser("~"), ".cache", "rst_to_qud", "parse_server.sock")
+
+#open client connections, keyed by address
+_connections = dict()
+
+#the parser and the budgets are shared by all connections, so requests are parsed one at a time
+_parse_lock = threading.Lock()
+
+
+def parse_address(address):
+    """
+    Split an address into socket family and socket address.
+
+    Parameter
+    ---------
+    address : String
+        "unix:PATH", a path starting with "/", or "HOST:PORT"
+
+    Returns
+    -------
+    family : int
+        socket.AF_UNIX or socket.AF_INET
+    socket_address : String or (String, int)
+        path of the Unix domain socket or host and port
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if address.startswith("/"):
+        return socket.AF_UNIX, address
+
+    host, port = address.rsplit(":", 1)
+    return socket.AF_INET, (host, int(port))
+
+
+class Parse_Request_Handler(socketserver.StreamRequestHandler):
+    """Answer requests on one connection until the client closes it, on a thread of its own."""
+
+    def handle(self):
+        import extract_question_content as eqc
+        import jpype
+
+        #each connection is handled on its own thread, which has to be known to the JVM
+        if jpype.isJVMStarted() and not jpype.isThreadAttachedToJVM():
+            jpype.attachThreadToJVM()
+
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode("utf-8"))
+
+                if request.get("ping"):
+                    answer = {"pong": True}
+                else:
+                    texts = request["texts"]
+                    model = request.get("model")
+                    with _parse_lock:
+                        eqc.set_budgets(request.get("max_tokens"), request.get("max_parse_time"))
+                        answer = {"results": eqc.extract_variants(texts, model=model)}
+            except Exception as ex:
+                answer = {"error": str(ex)}
+
+            self.wfile.write((json.dumps(answer) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class Unix_Parse_Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCP_Parse_Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def serve(address=DEFAULT_ADDRESS, model=None):
+    """
+    Load the parser and answer requests until interrupted.
+
+    Each connection is served on its own thread, so clients keeping their connections open
+    don't block each other. Requests are parsed one after another, since the parser is single threaded.
+
+    Parameters
+    ----------
+    address : String
+        address to listen on
+    model : String
+        parser model to load ahead of the first request, parser_manager.default_model if None
+    """
+    import parser_manager
+    import tregex_patterns
+
+    parser_manager.preload([model] if model else None)
+    tregex_patterns.compile_all()
+
+    family, socket_address = parse_address(address)
+
+    if family == socket.AF_UNIX:
+        directory = os.path.dirname(socket_address)
+        if directory != "" and not os.path.isdir(directory):
+            os.makedirs(directory)
+        if os.path.exists(socket_address):
+            os.remove(socket_address)
+        server = Unix_Parse_Server(socket_address, Parse_Request_Handler)
+    else:
+        server = TCP_Parse_Server(socket_address, Parse_Request_Handler)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if family == socket.AF_UNIX and os.path.exists(socket_address):
+            os.remove(socket_address)
+
+
+def _connect(address, timeout):
+    family, socket_address = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_address)
+    except OSError:
+        sock.close()
+        raise
+
+    return sock, sock.makefile("rb")
+
+
+def _send(address, request, timeout):
+    if not address in _connections:
+        _connections[address] = _connect(address, timeout)
+
+    sock, reader = _connections[address]
+    sock.settimeout(timeout)
+    sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+    line = reader.readline()
+    if line == b"":
+        raise OSError("Parse server closed the connection")
+
+    return json.loads(line.decode("utf-8"))
+
+
+def _close(address):
+    sock, reader = _connections.pop(address)
+    reader.close()
+    sock.close()
+
+
+def request(texts, address=DEFAULT_ADDRESS, model=None, max_tokens=None, max_parse_time=None, timeout=600):
+    """
+    Let the parse server extract the question contents of texts.
+
+    Parameters
+    ----------
+    texts : [String]
+        texts to parse
+    address : String
+        address of the server
+    model : String
+        parser model to use, the server's default model if None
+    max_tokens : int
+        maximum number of tokens of a text to be parsed, no limit if None
+    max_parse_time : float
+        maximum time in seconds for parsing a text, no limit if None
+    timeout : float
+        seconds to wait for the answer
+
+    Return
+    ------
+    question_contents : [([String], [String], String)]
+        for each text the words of the question content with and without gerund
+        and the exceeded budget, see extract_question_content.extract_variants,
+        in the same order as texts, None if the server can't be reached
+    """
+    message = {"texts": list(texts), "max_tokens": max_tokens, "max_parse_time": max_parse_time}
+    if not model is None:
+        message["model"] = model
+
+    #a connection kept from an earlier request may have been closed by a restarted server,
+    #in that case try once more with a fresh connection
+    reused = address in _connections
+    try:
+        answer = _send(address, message, timeout)
+    except (OSError, ValueError):
+        if address in _connections:
+            _close(address)
+        if not reused:
+            return None
+        try:
+            answer = _send(address, message, timeout)
+        except (OSError, ValueError):
+            if address in _connections:
+                _close(address)
+            return None
+
+    if "error" in answer:
+        raise Exception("Parse server: " + answer["error"])
+
+    return [tuple(result) for result in answer["results"]]
+
+
+def is_running(address=DEFAULT_ADDRESS, timeout=1):
+    """Check if a parse server answers at address."""
+    try:
+        answer = _send(address, {"ping": True}, timeout)
+    except (OSError, ValueError):
+        if address in _connections:
+            _close(address)
+        return False
+
+    return answer.get("pong", False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep a warm Stanford parser and answer extraction requests")
+    parser.add_argument('--address', default=DEFAULT_ADDRESS, help="'unix:PATH' or 'HOST:PORT' to listen on.")
+    parser.add_argument('--model', default=None, help="Parser model to load at startup.")
+
+    args = parser.parse_args()
+
+    serve(args.address, args.model)
@@ -0,0 +1,130 @@
+"""
+Process-wide manager for the Stanford parser.
+
+Starting the JVM and deserializing a parser model takes several seconds,
+so both are done at most once per process and the loaded models are kept
+for later calls.
+"""
+
+import os
+import time
+
+import lazy_import
+
+#imported on first use, see lazy_import.py
+jpype = lazy_import.lazy_module("jpype")
+
+
+DEFAULT_MODEL = "edu/stanford/nlp/models/lexparser/englishPCFG.ser.gz"
+
+#version of the Stanford parser on the classpath, part of the parse cache keys
+PARSER_VERSION = os.environ.get("STANFORD_PARSER_VERSION", "3.9.1")
+
+#model used by get_parser() when no model is given
+default_model = DEFAULT_MODEL
+
+#loaded parsers and the time it took to load them, keyed by model path
+_parsers = {}
+_load_times = {}
+
+
+def start_jvm():
+    """
+    Start the JVM with the classpath from the CLASSPATH environment variable,
+    unless it is already running.
+    """
+    if jpype.isJVMStarted():
+        return
+
+    classpath = os.environ.get('CLASSPATH')
+    if classpath is None:
+        raise Exception("Java classpath not set")
+
+    jpype.startJVM(jpype.getDefaultJVMPath(), "-Djava.class.path=%s" % classpath)
+
+
+def set_default_model(model):
+    """
+    Set the model used by get_parser() when no model is given.
+
+    Parameter
+    ---------
+    model : String
+        path of the serialized parser model inside the classpath
+    """
+    global default_model
+    default_model = model
+
+
+def get_parser(model=None):
+    """
+    Return the parser for a model, loading it on first use.
+
+    Parameter
+    ---------
+    model : String
+        path of the serialized parser model inside the classpath,
+        default_model if None
+
+    Return
+    ------
+    parser : LexicalizedParser
+        loaded parser
+    """
+    if model is None:
+        model = default_model
+
+    if not model in _parsers:
+        start_jvm()
+
+        start = time.time()
+        LexicalizedParser = jpype.JPackage("edu").stanford.nlp.parser.lexparser.LexicalizedParser
+        _parsers[model] = LexicalizedParser.loadModel(model)
+        _load_times[model] = time.time() - start
+
+    return _parsers[model]
+
+
+def preload(models=None):
+    """
+    Load parser models ahead of the first parse.
+
+    Parameter
+    ---------
+    models : [String]
+        models to load, [default_model] if None
+    """
+    if models is None:
+        models = [default_model]
+
+    for model in models:
+        get_parser(model)
+
+
+def is_loaded(model=None):
+    """Check if a model has already been loaded."""
+    if model is None:
+        model = default_model
+
+    return model in _parsers
+
+
+def load_times():
+    """
+    Return the time it took to load each model.
+
+    Return
+    ------
+    times : dict
+        dict with model paths as keys and load times in seconds as values
+    """
+    return dict(_load_times)
+
+
+def unload(model=None):
+    """Drop a loaded model, so that it is loaded again on next use."""
+    if model is None:
+        model = default_model
+
+    _parsers.pop(model, None)
+    _load_times.pop(model, None)
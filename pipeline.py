@@ -0,0 +1,221 @@
+"""
+Streaming transformation of a corpus of rst trees.
+
+transform_corpus reads, transforms and writes the trees in three stages.
+Reading and writing run on their own threads, connected to the transformation
+by bounded queues, so that only a few trees are in memory at a time and
+file access overlaps with parsing. Results are yielded as soon as
+a tree has been written, in the order of the input paths.
+"""
+
+from collections import namedtuple
+import queue
+import sys
+import threading
+
+import read_rst as rr
+import transform_rst as tr
+
+
+#path : path of the rst tree
+#rst_tree : Rst_Node, None if reading failed
+#qud_tree : Qud_Node, None if reading failed
+#filename : file the QUD tree was written to, None if it wasn't written
+#error : exception raised while reading the rst tree, None if there was none
+Transform_Result = namedtuple("Transform_Result", ["path", "rst_tree", "qud_tree", "filename", "error"])
+
+#marks the end of the items in a queue
+_DONE = object()
+
+#seconds between checks whether a stage should stop, while it waits for a full queue
+_POLL_INTERVAL = 0.1
+
+
+def transform_corpus(rst_paths, output_filename=None, backend=None, queue_size=4, render=True):
+    """
+    Read, transform and write rst trees, yielding the results one by one.
+
+    Errors while reading a tree are reported in its result.
+    Errors while transforming or writing are raised by the generator.
+
+    Parameters
+    ----------
+    rst_paths : iterable of String
+        paths of the rs3 files, consumed lazily
+    output_filename : function
+        function taking the path of an rst tree and returning the filename
+        to write its QUD tree to, or None to skip writing it;
+        no tree is written if output_filename is None
+    backend : String
+        name of the question content extractor to use,
+        extract_question_content.default_backend if None
+    queue_size : int
+        number of trees that can wait between two stages
+    render : Boolean
+        if True, compute all QUDs in the transformation stage,
+        otherwise they are computed when they are first read (see transform_rst.Qud_Renderer),
+        e.g. by the writing stage
+
+    Yields
+    ------
+    result : Transform_Result
+        result for each path, in the order of rst_paths
+    """
+    read_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    #holds at most the trees between the transformation and the caller, so it needs no bound
+    result_queue = queue.Queue()
+    stop = threading.Event()
+
+    reader = threading.Thread(target=_read_stage, args=(rst_paths, read_queue, stop))
+    writer = threading.Thread(target=_write_stage, args=(write_queue, result_queue, output_filename, stop))
+    reader.daemon = True
+    writer.daemon = True
+    reader.start()
+    writer.start()
+
+    try:
+        while True:
+            item = read_queue.get()
+            if item is _DONE:
+                _put(write_queue, _DONE, stop, writer)
+                break
+
+            if isinstance(item, _Stage_Error):
+                item.reraise()
+
+            path, rst_tree, error = item
+            qud_tree = None
+            if error is None:
+                qud_tree = tr.transform_rst(rst_tree, backend=backend)
+                if render:
+                    render_qud_tree(qud_tree)
+
+            if not _put(write_queue, (path, rst_tree, qud_tree, error), stop, writer):
+                #the writer has failed, its error is in result_queue
+                break
+
+            for result in _get_ready(result_queue):
+                yield result
+
+        while True:
+            result = result_queue.get()
+            if result is _DONE:
+                return
+            yield _check(result)
+    finally:
+        stop.set()
+
+
+def render_qud_tree(qud_tree):
+    """Compute all QUDs of a transformed tree that haven't been computed yet."""
+    for node, _, _, _ in qud_tree.iter_preorder():
+        node.qud
+
+
+class _Stage_Error:
+    """Exception raised in a stage thread, passed on to the thread running the generator."""
+
+    def __init__(self, exception):
+        self.exception = exception
+
+    def reraise(self):
+        raise self.exception
+
+
+def _check(result):
+    if isinstance(result, _Stage_Error):
+        result.reraise()
+    return result
+
+
+def _get_ready(result_queue):
+    """Yield the results that are ready without waiting for more."""
+    while True:
+        try:
+            result = result_queue.get_nowait()
+        except queue.Empty:
+            return
+        #_DONE is only put after the generator has put _DONE itself
+        yield _check(result)
+
+
+def _put(target_queue, item, stop, consumer=None):
+    """
+    Put item into a bounded queue, waiting while it is full.
+
+    Parameters
+    ----------
+    target_queue : Queue
+        queue to put item into
+    item : object
+        item to put
+    stop : Event
+        stop waiting when set
+    consumer : Thread
+        thread taking the items from the queue, stop waiting when it has ended
+
+    Return
+    ------
+    put : Boolean
+        False if the item couldn't be put
+    """
+    while not stop.is_set() and (consumer is None or consumer.is_alive()):
+        try:
+            target_queue.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read_stage(rst_paths, read_queue, stop):
+    try:
+        for path in rst_paths:
+            try:
+                item = (path, rr.read_rst_from_microtexts(path), None)
+            except Exception as ex:
+                item = (path, None, ex)
+            if not _put(read_queue, item, stop):
+                return
+    except Exception as ex:
+        #e.g. raised by the iterator of the paths
+        _put(read_queue, _Stage_Error(ex), stop)
+        return
+
+    _put(read_queue, _DONE, stop)
+
+
+def _attach_to_jvm():
+    """Make the JVM accept calls from this thread, which writing QUDs that aren't rendered yet needs."""
+    #the JVM can only have been started if jpype has been imported
+    jpype = sys.modules.get("jpype")
+    if not jpype is None and jpype.isJVMStarted() and not jpype.isThreadAttachedToJVM():
+        jpype.attachThreadToJVM()
+
+
+def _write_stage(write_queue, result_queue, output_filename, stop):
+    while not stop.is_set():
+        try:
+            item = write_queue.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+
+        if item is _DONE:
+            result_queue.put(_DONE)
+            return
+
+        path, rst_tree, qud_tree, error = item
+        filename = None
+
+        try:
+            if not qud_tree is None and not output_filename is None:
+                filename = output_filename(path)
+                if not filename is None:
+                    _attach_to_jvm()
+                    qud_tree.write_tree(filename)
+        except Exception as ex:
+            result_queue.put(_Stage_Error(ex))
+            return
+
+        result_queue.put(Transform_Result(path, rst_tree, qud_tree, filename, error))
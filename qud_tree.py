@@ -1,4 +1,3 @@
-
 class Qud_Node:
     """
     Class representing a QUD tree.
@@ -9,16 +8,52 @@ class Qud_Node:
         elemental discourse unit represented by this node
     qud : String
         Question under discussion. Is None for leaf nodes.
+        For nodes created with a render function (taking the node and returning the QUD),
+        it is computed when it is first read.
     children : [Qud_Node]
         children of this node
+    relation : String
+        RST relation the QUD was formed from, None if it isn't known
+    side : int
+        rst_tree.SIDE_LEFT or rst_tree.SIDE_RIGHT, the side of the satellite in that relation,
+        None if it isn't known
+    subtree : Rst_Node
+        RST subtree the question content of the QUD is taken from, None if it isn't known
+    source_ids : (String)
+        node_ids of the RST nodes this node was made from: the nucleus and the satellite 
+        of the relation (for a multinuclear restatement, the previous and the next nucleus),
+        or the node of the EDU for leaves; None if it isn't known
     """
 
-    def __init__(self, edu=None, qud=None):
+    __slots__ = ("edu", "_qud", "children", "relation", "side", "subtree", "source_ids", "_render")
+
+    def __init__(self, edu=None, qud=None, relation=None, side=None, subtree=None, source_ids=None, render=None):
         self.edu = edu
-        self.qud = qud
+        self._qud = qud
+        self.relation = relation
+        self.side = side
+        self.subtree = subtree
+        self.source_ids = source_ids
+        self._render = render
 
         self.children = []
 
+    @property
+    def qud(self):
+        if self._qud is None and not self._render is None:
+            self._qud = self._render(self)
+            self._render = None
+        return self._qud
+
+    @qud.setter
+    def qud(self, qud):
+        self._qud = qud
+        self._render = None
+
+    def is_rendered(self):
+        """Check if the QUD of this node doesn't have to be computed anymore."""
+        return self._render is None
+
     def add_child(self, child):
         """Add child to node."""
         if not isinstance(child, Qud_Node):
@@ -26,6 +61,59 @@ class Qud_Node:
 
         self.children.append(child)
 
+    def is_leaf(self):
+        """Check if this node has no children."""
+        return self.children == []
+
+    def iter_preorder(self):
+        """
+        Iterate over the nodes of this tree, each node before its children.
+
+        Yields
+        ------
+        node : Qud_Node
+            node of the tree
+        depth : int
+            distance of node from this node
+        relation : String
+            node.relation
+        side : int
+            node.side
+        """
+        stack = [(self, 0, self.relation, self.side)]
+        while stack:
+            item = stack.pop()
+            yield item
+            depth = item[1] + 1
+            for child in reversed(item[0].children):
+                stack.append((child, depth, child.relation, child.side))
+
+    def iter_postorder(self):
+        """
+        Iterate over the nodes of this tree, each node after its children.
+        Yields the same tuples as iter_preorder.
+        """
+        stack = [((self, 0, self.relation, self.side), False)]
+        while stack:
+            item, expanded = stack.pop()
+            if expanded:
+                yield item
+                continue
+
+            stack.append((item, True))
+            depth = item[1] + 1
+            for child in reversed(item[0].children):
+                stack.append(((child, depth, child.relation, child.side), False))
+
+    def iter_leaves(self):
+        """
+        Iterate over the leaves of this tree from left to right.
+        Yields the same tuples as iter_preorder.
+        """
+        for item in self.iter_preorder():
+            if item[0].is_leaf():
+                yield item
+
     def _get_tree_str(self, indent=0):
         """
         Return a string representing this tree.
@@ -36,15 +124,16 @@ class Qud_Node:
         indent : int
             level of node in tree
         """
-        if self.children == []:
-            tree_str = indent * ">" + str(self.edu) + "\n"
-        else:
-            tree_str = indent * ">" + str(self.qud) + "\n"
+        lines = []
 
-        for child in self.children:
-            tree_str += child._get_tree_str(indent+1)
+        for node, depth, _, _ in self.iter_preorder():
+            if node.is_leaf():
+                label = node.edu
+            else:
+                label = node.qud
+            lines.append((indent + depth) * ">" + str(label) + "\n")
 
-        return tree_str
+        return "".join(lines)
 
     def print_tree(self):
         """
@@ -69,12 +158,4 @@ class Qud_Node:
 
     def get_depth(self):
         """Return depth of this tree."""
-        if self.children == []:
-            return 0
-
-        max_child_depth = 0
-        for child in self.children:
-            depth = child.get_depth()
-            if depth > max_child_depth:
-                max_child_depth = depth
-        return max_child_depth + 1
+        return max(depth for _, depth, _, _ in self.iter_leaves())
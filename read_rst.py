@@ -1,17 +1,29 @@
+import collections as col
+import sys
+import tarfile
 import xml.etree.ElementTree as ET
+import zipfile
 
 import relations
 from rst_tree import Rst_Node
 
 
+#Node of an rst tree as read from an rs3 file, keeping only what is needed to build the tree.
+#id, parent, relname and type are the attributes of the xml element (None if missing),
+#text is the text of the element, edu_num the position of the EDU in text,
+#which is None for groups.
+Rst_Record = col.namedtuple("Rst_Record", ["id", "parent", "relname", "type", "text", "edu_num"])
+
+
 def read_rst_from_microtexts(filename):
     """
     Read rst tree from microtexts corpus
     
     Parameter
     ---------
-    filename : String
-        Filename/filepath of xml file containing the rst tree.
+    filename : String or file
+        Filename/filepath of xml file containing the rst tree,
+        or a file object opened in binary mode.
 
     Returns
     -------
@@ -19,39 +31,164 @@ def read_rst_from_microtexts(filename):
         Same rst tree represented as Rst_Node.
     """
 
-    xml_tree = ET.parse(filename)
-    xml_root = xml_tree.getroot()
-    xml_body = xml_root.find("body")
+    nodes = read_records(filename)
 
-    segments = xml_body.findall("segment")
-    segments_numbered = zip(segments, list(range(len(segments))))
-    groups = xml_body.findall("group")
-    groups_numbered = zip(groups, [None] * len(groups))
+    root = next(filter(lambda x : x.parent is None, nodes))
 
+    index = index_nodes(nodes)
+    
+    ret_tree = build_tree(nodes, root=root, index=index)
+    ret_tree.index_text()
+
+    return ret_tree
 
-    nodes = list(segments_numbered) + list(groups_numbered)
 
+def read_records(source):
+    """
+    Read the segments and groups of an rs3 file.
 
+    The file is parsed incrementally and each element is discarded
+    as soon as its record is made, so the xml tree is never held in memory.
 
-    
-    root = list(filter(lambda x : not 'parent' in x[0].attrib.keys(), nodes))[0]
-    
-    ret_tree = build_tree(nodes, root=root)
+    Parameter
+    ---------
+    source : String or file
+        name of the rs3 file or file object opened in binary mode
+
+    Return
+    ------
+    nodes : [Rst_Record]
+        segments in the order of the text, followed by the groups in the order of the file
+    """
+    segments = []
+    groups = []
+
+    #elements from the root down to the current one
+    path = []
+
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            path.append(element)
+            continue
+
+        path.pop()
+
+        if element.tag in ("segment", "group") and len(path) > 0 and path[-1].tag == "body":
+            attribs = element.attrib
+            relname = attribs.get("relname")
+            node_type = attribs.get("type")
+            record = Rst_Record(id=attribs["id"],
+                                parent=attribs.get("parent"),
+                                relname=None if relname is None else sys.intern(relname),
+                                type=None if node_type is None else sys.intern(node_type),
+                                text=element.text,
+                                edu_num=None)
+
+            if element.tag == "segment":
+                segments.append(record._replace(edu_num=len(segments)))
+            else:
+                groups.append(record)
+
+            element.clear()
+            path[-1].remove(element)
+        elif len(path) > 0 and path[-1].tag == "header":
+            #relation definitions etc. aren't needed
+            element.clear()
+            path[-1].remove(element)
+
+    return segments + groups
+
+
+def read_rst_archive(filename, suffix=".rs3"):
+    """
+    Read the rst trees in a zip or tar archive without extracting it.
+
+    Parameters
+    ----------
+    filename : String
+        name of the archive
+    suffix : String
+        only members whose names end with suffix are read
+
+    Return
+    ------
+    trees : generator of (String, Rst_Node)
+        names of the members and the trees read from them, in the order of the archive
+    """
+    if zipfile.is_zipfile(filename):
+        with zipfile.ZipFile(filename) as archive:
+            for name in archive.namelist():
+                if name.endswith(suffix):
+                    with archive.open(name) as member:
+                        yield name, read_rst_from_microtexts(member)
+    else:
+        with tarfile.open(filename, "r:*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.endswith(suffix):
+                    yield member.name, read_rst_from_microtexts(archive.extractfile(member))
 
-    return ret_tree
 
-def build_tree(nodes, root):
+def index_nodes(nodes):
+    """
+    Index the nodes of an rst tree by their parents and find the leftmost EDU below each node.
+
+    Parameter
+    ---------
+    nodes : [Rst_Record]
+        nodes of the rst tree
+
+    Returns
+    -------
+    children : dict
+        dict with node ids as keys and lists of the elements of nodes
+        whose parent is that node as values, in the order of nodes
+    leftmost : dict
+        dict with node ids as keys and the position of the leftmost EDU
+        dominated by the node (including its satellites) as values
+    """
+    children = col.defaultdict(list)
+    for node in nodes:
+        if not node.parent is None:
+            children[node.parent].append(node)
+
+    leftmost = dict()
+    for node in nodes:
+        if node.id in leftmost:
+            continue
+
+        #post-order traversal, so that the children of a node are done before the node itself
+        stack = [(node, False)]
+        while stack != []:
+            curr, expanded = stack.pop()
+            curr_id = curr.id
+
+            if not curr.edu_num is None:
+                leftmost[curr_id] = curr.edu_num
+            elif expanded:
+                #use edu number of leftmost satellite/child
+                leftmost[curr_id] = min([leftmost[child.id] for child in children[curr_id]])
+            else:
+                stack.append((curr, True))
+                for child in children[curr_id]:
+                    if not child.id in leftmost:
+                        stack.append((child, False))
+
+    return children, leftmost
+
+
+def build_tree(nodes, root, index=None):
     """
     Build rst tree recursively.
 
     Parameters
     ----------
-    nodes : [(xml.etree.ElementTree.Element,int)]
-        tuples of nodes of the rst tree represented as xml element
-        and ints giving the position of the corresponding EDUs in text
-        int is None if the node doesn't contain text
-    root : xml.etree.ElementTree.Element
+    nodes : [Rst_Record]
+        nodes of the rst tree
+    root : Rst_Record
         element of nodes, that becomes root node of returned tree
+    index : (dict, dict)
+        children and leftmost EDUs of the nodes as returned by index_nodes,
+        computed from nodes if None
 
     Returns
     -------
@@ -59,264 +196,243 @@ def build_tree(nodes, root):
         root node, with attributes sattelites and children 
         containing the subtrees attached to the root node
     """
-    
-    attributes=root[0].attrib
 
+    if index is None:
+        index = index_nodes(nodes)
     
-    if not "type" in attributes.keys():
+    if root.type is None:
         children = []
         multi_nuc_relation = None
-    elif attributes["type"] == "multinuc":
-        children = find_children(nodes, root)
-        multi_nuc_relation = children[0][0].attrib["relname"]
-    elif attributes["type"] == "span":
-        children = find_span_children(nodes,root)
+    elif root.type == "multinuc":
+        children = find_children(nodes, root, index=index)
+        multi_nuc_relation = children[0].relname
+    elif root.type == "span":
+        children = find_span_children(nodes, root, index=index)
         multi_nuc_relation = None
     else:
         children = []
         multi_nuc_relation = None
     
-    node = Rst_Node(edu=root[0].text, edu_num=root[1], multi_nuc_relation=multi_nuc_relation)
+    node = Rst_Node(edu=root.text, edu_num=root.edu_num, multi_nuc_relation=multi_nuc_relation, node_id=root.id)
 
     for child in children:
-        child_tree = build_tree(nodes, child)
+        child_tree = build_tree(nodes, child, index)
         node.add_child(child_tree)
 
     
-    satellites_left, satellites_right = find_satellites(nodes, root)
+    satellites_left, satellites_right = find_satellites(nodes, root, index=index)
 
     for satellite in satellites_left:
-        relname = satellite[0].attrib["relname"]
-        satellite_tree = build_tree(nodes, satellite)
+        relname = satellite.relname
+        satellite_tree = build_tree(nodes, satellite, index)
         node.add_satellite_left(satellite_tree, relname)
     for satellite in satellites_right:
-        relname = satellite[0].attrib["relname"]
-        satellite_tree = build_tree(nodes, satellite)
+        relname = satellite.relname
+        satellite_tree = build_tree(nodes, satellite, index)
         node.add_satellite_right(satellite_tree, relname)
         
     return node
 
 
-def find_children(nodes, parent, debug=False):
+def find_children(nodes, parent, debug=False, index=None):
     """
     Find children in multinuclear relation.
  
     Parameters
     ----------
-    nodes : [(xml.etree.ElementTree.Element, int)]
-        tuples of nodes of the rst tree represented as xml element
-        and ints giving the position of the corresponding EDUs in text
-        int is None if the node doesn't contain text
-    parent : (xml.etree.ElementTree.Element, int)
+    nodes : [Rst_Record]
+        nodes of the rst tree
+    parent : Rst_Record
         element of nodes whose children (in multinuclear relations) are to be returned
+    index : (dict, dict)
+        children and leftmost EDUs of the nodes as returned by index_nodes,
+        computed from nodes if None
 
     Returns
     -------
-    children : [(xml.etree.ElementTree.Element, int)]
+    children : [Rst_Record]
         child nodes in the multinuclear relation
     """
-    parent_id = parent[0].attrib["id"]
+    if index is None:
+        index = index_nodes(nodes)
+    children_index, leftmost = index
 
-    def parent_filter(n):
-        if not "parent" in n[0].attrib.keys():
-            return False
-        else:
-            return n[0].attrib["parent"] == parent_id
+    parent_id = parent.id
     
     def relname_filter(n):
-        if not "relname" in n[0].attrib.keys():
-            return False
-        else:
-            return n[0].attrib["relname"] in relations.multi_nuc
+        return n.relname in relations.multi_nuc
 
-    children_and_satellites = filter(parent_filter, nodes)
+    children_and_satellites = children_index.get(parent_id, [])
     children = list(filter(relname_filter, children_and_satellites))
 
-    children = reorder_children(children, nodes)
+    children = reorder_children(children, nodes, leftmost=leftmost)
         
     return children
 
 
-def reorder_children(children, nodes):
+def reorder_children(children, nodes, leftmost=None):
     """
     Reorder xml representations of children or satellites of one node according to the edus dominated by them.
 
     Parameters
     ----------
-    children : [(xml.etree.ElementTree.Element, int)]
+    children : [Rst_Record]
         list to be reordered
-    nodes : [(xml.etree.ElementTree.Element, int)]
+    nodes : [Rst_Record]
         list of all nodes in tree
+    leftmost : dict
+        leftmost EDUs of the nodes as returned by index_nodes,
+        computed from nodes if None
     
     Returns
     -------
-    reordered : [(xml.etree.ElementTree.Element, int)]
+    reordered : [Rst_Record]
         reordered list
     """
-    
-    def find_edu_number(node):
-        if not node[1] is None:
-            return node
-        parent_id = node[0].attrib["id"]
-        edu_number = 0
-        numbers = []
-        for n in nodes:
-            attribs = n[0].attrib
-            if "parent" in attribs.keys():
-                #find edu numbers of satelites and children
-                if attribs["parent"] == parent_id:
-                    numbers.append(find_edu_number(n)[1])
-        #use edu number of leftmost satellite/child
-        edu_number = min(numbers) 
-
-        return (node[0], edu_number)
+    if leftmost is None:
+        _, leftmost = index_nodes(nodes)
 
-    
-    children = list(map(find_edu_number, children))
-    snd = lambda x : x[1]
-    return sorted(children, key=snd)
+    children = [find_edu_number(child, leftmost) for child in children]
+    edu_num = lambda x : x.edu_num
+    return sorted(children, key=edu_num)
 
-    
 
+def find_edu_number(node, leftmost):
+    """
+    Annotate a node with the position of the leftmost EDU it dominates.
 
-def find_satellites(nodes, nucleus):
+    Parameters
+    ----------
+    node : Rst_Record
+        node to annotate
+    leftmost : dict
+        leftmost EDUs of the nodes as returned by index_nodes
+
+    Return
+    ------
+    node : Rst_Record
+        node itself if it contains text, otherwise a copy with the number of its leftmost EDU
+    """
+    if not node.edu_num is None:
+        return node
+
+    return node._replace(edu_num=leftmost[node.id])
+
+
+def find_satellites(nodes, nucleus, index=None):
     """
     Find satellites in mononuclear relation.
  
     Parameters
     ----------
-    nodes : [(xml.etree.ElementTree.Element, int)]
-        tuples of nodes of the rst tree represented as xml element
-        and ints giving the position of the corresponding EDUs in text
-        int is None if the node doesn't contain text
-    nucleus : (xml.etree.ElementTree.Element, int)
+    nodes : [Rst_Record]
+        nodes of the rst tree
+    nucleus : Rst_Record
         element of nodes whose satellites are to be returned
+    index : (dict, dict)
+        children and leftmost EDUs of the nodes as returned by index_nodes,
+        computed from nodes if None
 
     Returns
     -------
-    satellites_left : [(xml.etree.ElementTree.Element, int)]
+    satellites_left : [Rst_Record]
         satellites to the left of nucleus
-    satellites_right : [(xml.etree.ElementTree.Element, int)]
+    satellites_right : [Rst_Record]
         satellites to the right of nucleus
     """
+    if index is None:
+        index = index_nodes(nodes)
+    children_index, leftmost = index
 
-    nucleus_id = nucleus[0].attrib["id"]
-
-        
-
-    def parent_filter(n):
-        if not "parent" in n[0].attrib.keys():
-            return False
-        else:
-            return n[0].attrib["parent"] == nucleus_id
+    nucleus_id = nucleus.id
     
     def relname_filter(n):
-        if not "relname" in n[0].attrib.keys():
-            return False
-        else:
-            if n[0].attrib["relname"] == "sameunit":
-                #Throw error for sameunit tag, since the system currently can't deal with
-                #noncontiguous EDUs.
-                raise Exception("RST tree contains sameunit tag.")
-            return n[0].attrib["relname"] in relations.mono_nuc
+        if n.relname == "sameunit":
+            #Throw error for sameunit tag, since the system currently can't deal with
+            #noncontiguous EDUs.
+            raise Exception("RST tree contains sameunit tag.")
+        return n.relname in relations.mono_nuc
         
     
-    satellites_and_children = list(filter(parent_filter, nodes))
+    satellites_and_children = children_index.get(nucleus_id, [])
 
     satellites = list(filter(relname_filter, satellites_and_children))
 
-    satellites_left, satellites_right = reorder_satellites(satellites, nodes, nucleus)
+    satellites_left, satellites_right = reorder_satellites(satellites, nodes, nucleus, leftmost=leftmost)
     
     return satellites_left, satellites_right
 
 
-def reorder_satellites(satellites, nodes, nucleus):
+def reorder_satellites(satellites, nodes, nucleus, leftmost=None):
     """
     Reorder xml representations of satellites of one node according to the edus dominated by them
     and order them into lists according to their position relative to the nucleus.
 
     Parameters
     ----------
-    satellites : [(xml.etree.ElementTree.Element, int)]
+    satellites : [Rst_Record]
         list to be reordered
-    nodes : [(xml.etree.ElementTree.Element, int)]
+    nodes : [Rst_Record]
         list of all nodes in tree
-    nucleus : 
+    nucleus : Rst_Record
+        node the satellites belong to
+    leftmost : dict
+        leftmost EDUs of the nodes as returned by index_nodes,
+        computed from nodes if None
     
     Returns
     -------
-    satellites_left : [(xml.etree.ElementTree.Element, int)]
+    satellites_left : [Rst_Record]
         reordered list of satellites to the left of the nucleus
-    satellites_right : [(xml.etree.ElementTree.Element, int)]
+    satellites_right : [Rst_Record]
         reordered list of satellites to the right of the nucleus
     """
+    if leftmost is None:
+        _, leftmost = index_nodes(nodes)
+
+    satellites = [find_edu_number(satellite, leftmost) for satellite in satellites]
+    nucleus_pos = find_edu_number(nucleus, leftmost)
+
+    edu_num = lambda x : x.edu_num
+    left = lambda x : x.edu_num <= nucleus_pos.edu_num
+    right = lambda x : x.edu_num > nucleus_pos.edu_num
 
-    def find_edu_number(node):
-        if not node[1] is None:
-            return node
-        parent_id = node[0].attrib["id"]
-        edu_number = 0
-        numbers = []
-        for n in nodes:
-            attribs = n[0].attrib
-            if "parent" in attribs.keys():
-                #find edu numbers of satelites and children
-                if attribs["parent"] == parent_id:
-                    numbers.append(find_edu_number(n)[1])
-        #use edu number of leftmost satellite/child
-        edu_number = min(numbers) 
-
-        return (node[0], edu_number)
-
-    satellites = list(map(find_edu_number, satellites))
-    nucleus_pos = find_edu_number(nucleus)
-
-    snd = lambda x : x[1]
-    left = lambda x : x[1] <= nucleus_pos[1]
-    right = lambda x : x[1] > nucleus_pos[1]
-
-    satellites_left = sorted(filter(left, satellites), key=snd)
-    satellites_right = sorted(filter(right, satellites), key=snd)
+    satellites_left = sorted(filter(left, satellites), key=edu_num)
+    satellites_right = sorted(filter(right, satellites), key=edu_num)
     
     return satellites_left, satellites_right
 
 
-def find_span_children(nodes, parent):
+def find_span_children(nodes, parent, index=None):
     """
     Find children of a span node.
  
     Parameters
     ----------
-    nodes : [(xml.etree.ElementTree.Element, int)]
-        tuples of nodes of the rst tree represented as xml element
-        and ints giving the position of the corresponding EDUs in text
-        int is None if the node doesn't contain text
-    parent : (xml.etree.ElementTree.Element, int)
+    nodes : [Rst_Record]
+        nodes of the rst tree
+    parent : Rst_Record
         element of nodes whose children (in multinuclear relations) are to be returned
+    index : (dict, dict)
+        children and leftmost EDUs of the nodes as returned by index_nodes,
+        computed from nodes if None
 
     Returns
     -------
-    children : [(xml.etree.ElementTree.Element, int)]
+    children : [Rst_Record]
         child nodes in the multinuclear relation
     """
-    parent_id = parent[0].attrib["id"]
+    if index is None:
+        index = index_nodes(nodes)
+    children_index, _ = index
 
-    def parent_filter(n):
-        if not "parent" in n[0].attrib.keys():
-            return False
-        else:
-            return n[0].attrib["parent"] == parent_id
+    parent_id = parent.id
     
     def relname_filter(n):
-        if not "relname" in n[0].attrib.keys():
-            return False
-        else:
-            return n[0].attrib["relname"] == "span"
+        return n.relname == "span"
 
     
-    children_and_sattelites = filter(parent_filter, nodes)
+    children_and_sattelites = children_index.get(parent_id, [])
     children = list(filter(relname_filter, children_and_sattelites))
 
     return children
-
-
@@ -38,3 +38,44 @@ mono_nuc = ["antithesis",
             "unstated-relation",
             "evaluation-n",
             "reason"]
+
+
+#names of the relations, the position of a name is the id of the relation
+#relations missing from multi_nuc and mono_nuc are added by relation_id
+relation_names = multi_nuc + mono_nuc
+
+relation_ids = {name : i for i, name in enumerate(relation_names)}
+
+
+def relation_id(name):
+    """
+    Return the id of a relation, adding the relation if it is unknown.
+    The id of None is -1.
+    """
+    if name is None:
+        return -1
+
+    if not name in relation_ids:
+        relation_ids[name] = len(relation_names)
+        relation_names.append(name)
+
+    return relation_ids[name]
+
+
+def relation_name(rel_id):
+    """Return the name of the relation with an id, None for -1."""
+    if rel_id < 0:
+        return None
+
+    return relation_names[rel_id]
+
+
+def intern_relation(name):
+    """
+    Return the canonical string object for a relation name, None for None.
+    Nodes store relation names through this function, so equal names share one object.
+    """
+    if name is None:
+        return None
+
+    return relation_names[relation_id(name)]
@@ -0,0 +1,339 @@
+"""
+Compact storage for a whole corpus of rst trees.
+
+Instead of one Rst_Node object per node, an Rst_Forest keeps one entry per
+node in a few flat arrays, and the EDU texts of all trees in a single string.
+Rst_Forest_Node gives read access to a node with the attributes of Rst_Node.
+The arrays can be wrapped without copying, e.g. with numpy.frombuffer,
+to compute statistics over the whole corpus.
+"""
+
+import array
+import os
+
+import read_rst as rr
+import relations
+#positions of nodes relative to their parent, the same as in the traversals of Rst_Node
+from rst_tree import Rst_Node, SIDE_LEFT, SIDE_CHILD, SIDE_RIGHT
+
+
+#kinds of nodes
+KIND_EDU = 0
+KIND_SPAN = 1
+KIND_MULTINUC = 2
+
+
+class Rst_Forest:
+    """
+    Class representing a corpus of rst trees as columnar arrays.
+
+    The subtrees attached to a node (left satellites, children, right satellites,
+    in this order) are stored next to each other, starting at first_child[node].
+
+    Attributes
+    ----------
+    names : [String]
+        names of the trees, e.g. filenames
+    roots : array.array
+        index of the root node of each tree
+    parent : array.array
+        index of the parent of each node, -1 for roots
+    kind : array.array
+        KIND_EDU, KIND_SPAN or KIND_MULTINUC for each node
+    relation : array.array
+        id of the relation (see relations.relation_id) connecting each node to its parent,
+        -1 for roots and for the nuclei of span nodes
+    multi_nuc_relation : array.array
+        id of the relation of each multinuclear node, -1 for other nodes
+    side : array.array
+        SIDE_LEFT, SIDE_CHILD or SIDE_RIGHT for each node
+    edu_num : array.array
+        edu_num of each node (see Rst_Node), -1 if it is None
+    edu_start : array.array
+        offset of the EDU of each node in text, -1 if the node has no EDU
+    edu_end : array.array
+        end offset of the EDU of each node in text, -1 if the node has no EDU
+    first_child : array.array
+        index of the first subtree attached to each node
+    num_children : array.array
+        number of subtrees attached to each node
+    text : String
+        EDU texts of all trees
+    """
+
+    def __init__(self):
+        self.names = []
+        self.roots = array.array("i")
+
+        self.parent = array.array("i")
+        self.kind = array.array("b")
+        self.relation = array.array("h")
+        self.multi_nuc_relation = array.array("h")
+        self.side = array.array("b")
+        self.edu_num = array.array("i")
+        self.edu_start = array.array("i")
+        self.edu_end = array.array("i")
+        self.first_child = array.array("i")
+        self.num_children = array.array("i")
+
+        self._text_parts = []
+        self._text_length = 0
+        self._text = None
+
+    def __len__(self):
+        """Return the number of trees."""
+        return len(self.roots)
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = "".join(self._text_parts)
+            self._text_parts = [self._text]
+        return self._text
+
+    def num_nodes(self):
+        """Return the number of nodes of all trees."""
+        return len(self.parent)
+
+    def _add_node(self, parent, relation, side):
+        index = len(self.parent)
+
+        self.parent.append(parent)
+        self.kind.append(KIND_EDU)
+        self.relation.append(relation)
+        self.multi_nuc_relation.append(-1)
+        self.side.append(side)
+        self.edu_num.append(-1)
+        self.edu_start.append(-1)
+        self.edu_end.append(-1)
+        self.first_child.append(index)
+        self.num_children.append(0)
+
+        return index
+
+    def _add_text(self, text):
+        start = self._text_length
+        self._text_parts.append(text)
+        self._text_length += len(text)
+        self._text = None
+        return start, self._text_length
+
+    def add_tree(self, tree, name=None):
+        """
+        Add an rst tree to the forest.
+
+        Parameters
+        ----------
+        tree : Rst_Node
+            tree to add
+        name : String
+            name of the tree
+
+        Return
+        ------
+        index : int
+            position of the tree in the forest
+        """
+        root = self._add_node(-1, -1, SIDE_CHILD)
+        self.roots.append(root)
+        self.names.append(name)
+
+        #breadth-first, so that the subtrees attached to a node get consecutive indices
+        queue = [(tree, root)]
+        for node, index in queue:
+            if not node.edu_num is None:
+                self.edu_num[index] = node.edu_num
+            if not node.edu is None:
+                self.edu_start[index], self.edu_end[index] = self._add_text(node.edu)
+
+            child_nodes, multi_nuc_relation = node.children
+            if not node.edu is None:
+                self.kind[index] = KIND_EDU
+            elif multi_nuc_relation is None:
+                self.kind[index] = KIND_SPAN
+            else:
+                self.kind[index] = KIND_MULTINUC
+                self.multi_nuc_relation[index] = relations.relation_id(multi_nuc_relation)
+
+            subtrees = [(sat, relations.relation_id(rel), SIDE_LEFT) for sat, rel in node.get_satellites(SIDE_LEFT)]
+            child_relation = relations.relation_id(multi_nuc_relation)
+            subtrees += [(child, child_relation, SIDE_CHILD) for child in child_nodes]
+            subtrees += [(sat, relations.relation_id(rel), SIDE_RIGHT) for sat, rel in node.get_satellites(SIDE_RIGHT)]
+
+            self.first_child[index] = len(self.parent)
+            self.num_children[index] = len(subtrees)
+
+            for subtree, relation, side in subtrees:
+                queue.append((subtree, self._add_node(index, relation, side)))
+
+        return len(self.roots) - 1
+
+    def tree(self, i):
+        """Return the root of the i-th tree."""
+        return Rst_Forest_Node(self, self.roots[i])
+
+    def trees(self):
+        """Return pairs of names and roots of all trees."""
+        return [(name, Rst_Forest_Node(self, root)) for name, root in zip(self.names, self.roots)]
+
+    def relation_counts(self):
+        """
+        Count how often each relation is used in the corpus.
+
+        Return
+        ------
+        counts : dict
+            dict with relation names as keys and numbers of nodes attached by that relation as values
+        """
+        counts = dict()
+        for rel_id in self.relation:
+            if rel_id >= 0:
+                name = relations.relation_name(rel_id)
+                counts[name] = counts.get(name, 0) + 1
+        return counts
+
+
+class Rst_Forest_Node:
+    """
+    View on a node of an Rst_Forest, with the same attributes as Rst_Node.
+
+    Attributes
+    ----------
+    forest : Rst_Forest
+        forest containing the node
+    index : int
+        position of the node in the arrays of the forest
+    """
+
+    __slots__ = ("forest", "index")
+
+    def __init__(self, forest, index):
+        self.forest = forest
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, Rst_Forest_Node) and self.forest is other.forest and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.forest), self.index))
+
+    @property
+    def edu(self):
+        start = self.forest.edu_start[self.index]
+        if start < 0:
+            return None
+        return self.forest.text[start:self.forest.edu_end[self.index]]
+
+    @property
+    def edu_num(self):
+        edu_num = self.forest.edu_num[self.index]
+        if edu_num < 0:
+            return None
+        return edu_num
+
+    @property
+    def node_id(self):
+        #the forest doesn't keep the ids of the rs3 files
+        return None
+
+    def _subtrees(self, side):
+        forest = self.forest
+        first = forest.first_child[self.index]
+        last = first + forest.num_children[self.index]
+        return [i for i in range(first, last) if forest.side[i] == side]
+
+    @property
+    def children(self):
+        child_nodes = [Rst_Forest_Node(self.forest, i) for i in self._subtrees(SIDE_CHILD)]
+        relation = relations.relation_name(self.forest.multi_nuc_relation[self.index])
+        return (child_nodes, relation)
+
+    @property
+    def satellites_left(self):
+        return [(Rst_Forest_Node(self.forest, i), relations.relation_name(self.forest.relation[i]))
+                for i in self._subtrees(SIDE_LEFT)]
+
+    @property
+    def satellites_right(self):
+        return [(Rst_Forest_Node(self.forest, i), relations.relation_name(self.forest.relation[i]))
+                for i in self._subtrees(SIDE_RIGHT)]
+
+    def get_satellites(self, side):
+        """Return the satellites on one side, SIDE_LEFT or SIDE_RIGHT, see Rst_Node.get_satellites."""
+        if side == SIDE_LEFT:
+            return self.satellites_left
+        return self.satellites_right
+
+    def get_text(self):
+        """
+        Get combined EDUs dominated by by this node, separated by spaces.
+        """
+        forest = self.forest
+        edus = []
+
+        #subtrees are stored in text order, so a depth-first walk over them yields the EDUs in order
+        #an EDU comes after the left satellites of its node
+        stack = [(self.index, False)]
+        while stack:
+            index, edu_only = stack.pop()
+            start = forest.edu_start[index]
+
+            if edu_only:
+                edus.append(forest.text[start:forest.edu_end[index]])
+                continue
+
+            first = forest.first_child[index]
+            subtrees = range(first, first + forest.num_children[index])
+            for i in reversed(subtrees):
+                if forest.side[i] != SIDE_LEFT:
+                    stack.append((i, False))
+            if start >= 0:
+                stack.append((index, True))
+            for i in reversed(subtrees):
+                if forest.side[i] == SIDE_LEFT:
+                    stack.append((i, False))
+
+        return " ".join(edus)
+
+    def to_rst_node(self):
+        """Copy the subtree below this node into Rst_Nodes."""
+        node = Rst_Node(edu=self.edu, edu_num=self.edu_num, multi_nuc_relation=self.children[1])
+
+        for child in self.children[0]:
+            node.add_child(child.to_rst_node())
+        for sat, rel in self.satellites_left:
+            node.add_satellite_left(sat.to_rst_node(), rel)
+        for sat, rel in self.satellites_right:
+            node.add_satellite_right(sat.to_rst_node(), rel)
+
+        return node
+
+
+def load_corpus(path, suffix=".rs3"):
+    """
+    Read all rst trees of a corpus into an Rst_Forest.
+
+    Parameters
+    ----------
+    path : String
+        folder containing the rs3 files, or a zip or tar archive of them
+    suffix : String
+        only files whose names end with suffix are read
+
+    Return
+    ------
+    forest : Rst_Forest
+        trees of the corpus, named by their filenames
+    """
+    forest = Rst_Forest()
+
+    if os.path.isdir(path):
+        for filename in sorted(os.listdir(path)):
+            if filename.endswith(suffix):
+                tree = rr.read_rst_from_microtexts(os.path.join(path, filename))
+                forest.add_tree(tree, filename)
+    else:
+        for name, tree in rr.read_rst_archive(path, suffix=suffix):
+            forest.add_tree(tree, name)
+
+    return forest
@@ -1,3 +1,30 @@
+import relations
+
+
+#returned by get_satellites for nodes without satellites on one side,
+#so that reading them doesn't allocate a list
+_NO_SATELLITES = ()
+
+#positions of subtrees relative to the node they are attached to, yielded by the traversals
+SIDE_LEFT = -1
+SIDE_CHILD = 0
+SIDE_RIGHT = 1
+
+
+class _Text_Index:
+    """
+    Text buffer shared by all nodes indexed together by Rst_Node.index_text.
+
+    Changing any of these nodes resets text to None, so that every node of the tree,
+    not only the changed one, indexes its text again on the next call of get_text.
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
 class Rst_Node:
     """Class representing an RST tree.
 
@@ -7,6 +34,8 @@ class Rst_Node:
         elemental discourse unit corresponding to this node, provided it is a leave node
     edu_num : int
         position of edu in text (1, 2, 3, ...)
+    node_id : String
+        id of the segment or group the node was read from, None if it wasn't read from a file
     children : ([Rst_Node], String)
         Tuple of list of child nodes and relation type for multinuclear relation.
         If self is a span node, wich is above a mononuclear relation, the list just 
@@ -17,66 +46,273 @@ class Rst_Node:
         List of tuples representing the satellites to the left of the nucleus 
         in a mononuclear relation.
         The first element of the tuple is a satellite, the second one is the relation type.
+        The list is allocated on first access, use get_satellites to only read it.
     satellites_right: [(Rst_Node, String)]
         List of tuples representing the satellites to the right of the nucleus 
         in a mononuclear relation.
         The first element of the tuple is a satellite, the second one is the relation type.
+        The list is allocated on first access, use get_satellites to only read it.
+
+    The text of a tree is kept in one buffer shared by all its nodes,
+    each node stores the offsets of its text in that buffer (see index_text).
+    Setting edu, children or the satellites and calling add_child or add_satellite_left/right
+    invalidates the buffer for all nodes sharing it. Changing the lists of children or
+    satellites in place doesn't, call index_text on the root after doing so.
     """
+
+    __slots__ = ("_edu", "edu_num", "node_id", "_child_nodes", "_multi_nuc_relation", "_satellites_left", "_satellites_right",
+                 "_text_index", "_text_start", "_text_end")
     
-    def __init__(self, edu=None, edu_num=None, multi_nuc_relation=None):
-        self.edu = edu
+    def __init__(self, edu=None, edu_num=None, multi_nuc_relation=None, node_id=None):
+        self._edu = edu
         self.edu_num = edu_num
+        self.node_id = node_id
 
-        self.children = ([], multi_nuc_relation)
-        self.satellites_left = []
-        self.satellites_right = []
+        self._child_nodes = []
+        self._multi_nuc_relation = relations.intern_relation(multi_nuc_relation)
+        #lists are only allocated for the first satellite on each side
+        self._satellites_left = None
+        self._satellites_right = None
+
+        #set by index_text
+        self._text_index = None
+        self._text_start = 0
+        self._text_end = 0
+
+    @property
+    def edu(self):
+        return self._edu
+
+    @edu.setter
+    def edu(self, edu):
+        self._edu = edu
+        self._invalidate_text()
+
+    @property
+    def children(self):
+        return (self._child_nodes, self._multi_nuc_relation)
+
+    @children.setter
+    def children(self, children):
+        child_nodes, relname = children
+        self._child_nodes = child_nodes
+        self._multi_nuc_relation = relations.intern_relation(relname)
+        self._invalidate_text()
+
+    @property
+    def satellites_left(self):
+        #the caller may change the list, e.g. append to it
+        if self._satellites_left is None:
+            self._satellites_left = []
+        return self._satellites_left
+
+    @satellites_left.setter
+    def satellites_left(self, satellites):
+        self._satellites_left = self._make_satellite_list(satellites)
+        self._invalidate_text()
+
+    @property
+    def satellites_right(self):
+        if self._satellites_right is None:
+            self._satellites_right = []
+        return self._satellites_right
+
+    @satellites_right.setter
+    def satellites_right(self, satellites):
+        self._satellites_right = self._make_satellite_list(satellites)
+        self._invalidate_text()
+
+    def _invalidate_text(self):
+        """Mark the text of all nodes indexed together with this node as outdated."""
+        if not self._text_index is None:
+            self._text_index.text = None
+
+    def get_satellites(self, side):
+        """
+        Return the satellites on one side for reading, without allocating a list for a node without them.
+
+        Parameter
+        ---------
+        side : int
+            SIDE_LEFT or SIDE_RIGHT
+
+        Return
+        ------
+        satellites : [(Rst_Node, String)]
+            satellites and their relations, an empty tuple if there are none
+        """
+        if side == SIDE_LEFT:
+            satellites = self._satellites_left
+        else:
+            satellites = self._satellites_right
+
+        if satellites is None:
+            return _NO_SATELLITES
+        return satellites
+
+    @staticmethod
+    def _make_satellite_list(satellites):
+        if len(satellites) == 0:
+            return None
+        return [(satellite, relations.intern_relation(relname)) for satellite, relname in satellites]
 
     def add_child(self, child):
         """Add an Rst_Node to self.children."""
         if not isinstance(child, Rst_Node):
             raise TypeError("child must be an Rst_Node")
         
-        child_nodes, relname = self.children
-        child_nodes.append(child)
-        self.children = (child_nodes, relname)
+        self._child_nodes.append(child)
+        self._invalidate_text()
 
     def add_satellite_left(self, satellite, relname):
         """Add an Rst_Node as satellite with relation relname."""
         if not isinstance(satellite,Rst_Node):
             raise TypeError("satellite must be an Rst_Node")
 
-        self.satellites_left.append((satellite, relname))
+        if self._satellites_left is None:
+            self._satellites_left = []
+        self._satellites_left.append((satellite, relations.intern_relation(relname)))
+        self._invalidate_text()
 
     def add_satellite_right(self, satellite, relname):
         """Add an Rst_Node as satellite with relation relname."""
         if not isinstance(satellite,Rst_Node):
             raise TypeError("satellite must be an Rst_Node")
 
-        self.satellites_right.append((satellite, relname))
+        if self._satellites_right is None:
+            self._satellites_right = []
+        self._satellites_right.append((satellite, relations.intern_relation(relname)))
+        self._invalidate_text()
 
     def get_text(self):
         """
-        Get combined EDUs dominated by by this node.
+        Get combined EDUs dominated by by this node, separated by spaces.
+
+        The text is sliced from the buffer built by index_text,
+        which is called first if this node hasn't been indexed
+        or its tree has been changed since.
         """
-        text = ""
-        
-        for sat in self.satellites_left:
-            text += " " + sat[0].get_text()
+        if self._text_index is None or self._text_index.text is None:
+            self.index_text()
+
+        return self._text_index.text[self._text_start:self._text_end]
+
+    def index_text(self):
+        """
+        Join the EDUs of this tree into one buffer and store the offsets of the text of each node.
 
-        if not self.edu is None:
-            text += " " + self.edu
+        Changing a node invalidates the buffer of every node indexed together with it,
+        get_text indexes the text again when it is needed.
+        """
+        parts = []
+        length = 0
+        edu_starts = []
+        edu_ends = []
+        indexed = []
 
-        for child in self.children[0]:
-            text += " " + child.get_text()
+        #items are (node, None) to visit a node, (node, edu_count) to leave it
+        #and (None, edu) to add an edu, pushed in reverse order
+        stack = [(self, None)]
+        while stack:
+            node, item = stack.pop()
 
-        for sat in self.satellites_right:
-            text += " " + sat[0].get_text()
+            if node is None:
+                if parts:
+                    parts.append(" ")
+                    length += 1
+                edu_starts.append(length)
+                parts.append(item)
+                length += len(item)
+                edu_ends.append(length)
 
-        return text
-        
+            elif item is None:
+                stack.append((node, len(edu_starts)))
+                for sat, _ in reversed(node.get_satellites(SIDE_RIGHT)):
+                    stack.append((sat, None))
+                for child in reversed(node.children[0]):
+                    stack.append((child, None))
+                if not node._edu is None:
+                    stack.append((None, node._edu))
+                for sat, _ in reversed(node.get_satellites(SIDE_LEFT)):
+                    stack.append((sat, None))
+
+            else:
+                if len(edu_starts) > item:
+                    node._text_start = edu_starts[item]
+                    node._text_end = edu_ends[-1]
+                else:
+                    node._text_start = length
+                    node._text_end = length
+                indexed.append(node)
+
+        text_index = _Text_Index("".join(parts))
+        for node in indexed:
+            #nodes outside this subtree that shared the old buffer no longer cover their text
+            node._invalidate_text()
+            node._text_index = text_index
+
+    def _reversed_subtrees(self, depth):
+        """Yield (subtree, depth, relation, side) for the subtrees attached to this node, last one first."""
+        for sat, rel in reversed(self.get_satellites(SIDE_RIGHT)):
+            yield (sat, depth, rel, SIDE_RIGHT)
+        child_nodes, multi_nuc_relation = self.children
+        for child in reversed(child_nodes):
+            yield (child, depth, multi_nuc_relation, SIDE_CHILD)
+        for sat, rel in reversed(self.get_satellites(SIDE_LEFT)):
+            yield (sat, depth, rel, SIDE_LEFT)
+
+    def is_leaf(self):
+        """Check if no subtrees are attached to this node."""
+        return self._child_nodes == [] and not self._satellites_left and not self._satellites_right
+
+    def iter_preorder(self):
+        """
+        Iterate over the nodes of this tree, each node before the subtrees attached to it.
+
+        Subtrees are visited in text order: left satellites, children, right satellites.
+
+        Yields
+        ------
+        node : Rst_Node
+            node of the tree
+        depth : int
+            distance of node from this node
+        relation : String
+            relation connecting node to its parent, None for this node and nuclei of span nodes
+        side : int
+            SIDE_LEFT, SIDE_CHILD or SIDE_RIGHT, SIDE_CHILD for this node
+        """
+        stack = [(self, 0, None, SIDE_CHILD)]
+        while stack:
+            item = stack.pop()
+            yield item
+            stack.extend(item[0]._reversed_subtrees(item[1] + 1))
+
+    def iter_postorder(self):
+        """
+        Iterate over the nodes of this tree, each node after the subtrees attached to it.
+        Yields the same tuples as iter_preorder.
+        """
+        stack = [((self, 0, None, SIDE_CHILD), False)]
+        while stack:
+            item, expanded = stack.pop()
+            if expanded:
+                yield item
+                continue
+
+            stack.append((item, True))
+            for subtree in item[0]._reversed_subtrees(item[1] + 1):
+                stack.append((subtree, False))
+
+    def iter_leaves(self):
+        """
+        Iterate over the nodes of this tree without subtrees, in text order.
+        Yields the same tuples as iter_preorder.
+        """
+        for item in self.iter_preorder():
+            if item[0].is_leaf():
+                yield item
 
-                    
-        
     def print_tree(self):
         """
         Print this tree.
@@ -97,14 +333,14 @@ class Rst_Node:
 
             simplified.create_node(tag, node_id, parent)
 
-            for sat, rel in subtree.satellites_left:
+            for sat, rel in subtree.get_satellites(SIDE_LEFT):
                 queue.append((sat, rel, node_id))
 
             for child in subtree.children[0]:
                 rel = subtree.children[1]
                 queue.append((child, rel, node_id))
 
-            for sat, rel in subtree.satellites_right:
+            for sat, rel in subtree.get_satellites(SIDE_RIGHT):
                 queue.append((sat, rel, node_id))
 
             node_id += 1
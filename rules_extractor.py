@@ -0,0 +1,145 @@
+"""
+Rule-based question content extraction without the Stanford parser.
+
+Approximates extract_question_content.extract_from_text with a POS tagger and
+a chunk grammar: the first noun phrase followed by a verb is the subject,
+the rest of the text from that verb on is the verb phrase.
+Needs no JVM, so it answers in milliseconds, at the cost of accuracy.
+"""
+
+import conjugation
+import lazy_import
+
+#imported on first use, see lazy_import.py
+nltk = lazy_import.lazy_module("nltk")
+
+
+chunk_grammar = r"""
+    NP: {<DT|PDT|PRP\$|CD|JJ.*|NN.*|POS>*<NN.*|PRP|EX|CD>}
+    VG: {<MD>?<RB.*>*<VB.*>+}
+"""
+
+_chunk_parser = None
+
+
+def extract_from_text(text, gerund=True):
+    """
+    Extract the question content from a text using POS tags.
+
+    Parameters
+    ----------
+    text : String
+        text from which to extract the question content
+    gerund : Boolean
+        if True, turn the verb phrase into a gerund
+
+    Return
+    ------
+    question_content : [String]
+        words of the extracted phrase
+    """
+    return extract_both_from_text(text)[0 if gerund else 1]
+
+
+def extract_both_from_text(text):
+    """
+    Extract both variants of the question content from a text, tagging it only once.
+
+    Parameter
+    ---------
+    text : String
+        text from which to extract the question content
+
+    Returns
+    -------
+    gerund_words : [String]
+        words of the extracted phrase with the verb phrase turned into a gerund
+    plain_words : [String]
+        words of the extracted phrase without changes to the verb phrase
+    """
+    words = nltk.word_tokenize(text)
+
+    if words == []:
+        return [], []
+
+    tagged = nltk.pos_tag(words)
+
+    subject, verb_start = find_subject(tagged)
+
+    if subject is None:
+        return words, list(words)
+
+    verb_phrase = tagged[verb_start:]
+
+    return subject + ingify(verb_phrase), subject + [word for word, _ in verb_phrase]
+
+
+def find_subject(tagged):
+    """
+    Find the first noun phrase that is directly followed by a verb.
+
+    Parameter
+    ---------
+    tagged : [(String, String)]
+        POS tagged words
+
+    Returns
+    -------
+    subject : [String]
+        words of the noun phrase, None if there is none
+    verb_start : int
+        position of the first word of the verb following the noun phrase
+    """
+    global _chunk_parser
+    if _chunk_parser is None:
+        _chunk_parser = nltk.RegexpParser(chunk_grammar)
+
+    chunks = _chunk_parser.parse(tagged)
+
+    position = 0
+    #noun phrase right before the current chunk, None if there is none
+    subject = None
+
+    for chunk in chunks:
+        if isinstance(chunk, tuple):
+            #single word outside of any chunk, separates a noun phrase from a following verb
+            subject = None
+            position += 1
+            continue
+
+        label = chunk.label()
+        if label == "VG" and not subject is None:
+            return subject, position
+
+        if label == "NP":
+            subject = [word for word, _ in chunk.leaves()]
+        else:
+            subject = None
+
+        position += len(chunk.leaves())
+
+    return None, None
+
+
+def ingify(verb_phrase):
+    """
+    Turn a verb phrase into a gerund, if it starts with a verb in present tense (VBP).
+
+    Parameter
+    ---------
+    verb_phrase : [(String, String)]
+        POS tagged words of the verb phrase
+
+    Return
+    ------
+    words : [String]
+        words of the verb phrase
+    """
+    words = [word for word, _ in verb_phrase]
+
+    if verb_phrase[0][1] != "VBP":
+        return words
+
+    verb_progressive = conjugation.progressive(words[0])
+
+    return [verb_progressive] + words[1:]
@@ -1,19 +1,42 @@
 import re
 import os
-from nltk import word_tokenize
 import collections as col
+import multiprocessing as mp
 
+import conjugation
+import extract_question_content as eqc
+import lazy_import
+import parse_cache
+import parser_manager
 import qud_tree
 import read_rst as rr
 import transform_rst as tr
 import read_qud as rq
+import pipeline
+import relations
+import rules_extractor
+import tregex_patterns
 
+#imported on first use, see lazy_import.py
+nltk = lazy_import.lazy_module("nltk")
+np = lazy_import.lazy_module("numpy")
 
 
 
 
 
-def evaluate_transform(rst_path, gold_qud_path, transformed_path, result_filename, relations_filename):
+
+#result of evaluating the transformation of one RST tree against its gold QUD trees
+#code : file code of the RST tree
+#read_error : message of the error raised while reading the RST tree, None if there was none
+#results : [(line, relations_total, relations_spans)] for each gold tree that could be compared,
+#    the line for the result file and the relation counts returned by calculate_kappa
+#errors : [(name, message)] for each gold tree that couldn't be compared
+#failure : exception that ended the evaluation, None if there was none
+Code_Result = col.namedtuple("Code_Result", ["code", "read_error", "results", "errors", "failure"])
+
+
+def evaluate_transform(rst_path, gold_qud_path, transformed_path, result_filename, relations_filename, jobs=1):
     """
     Evaluate the transform function by transforming RST trees
     and comparing them to human-annotated QUD trees.
@@ -30,6 +53,9 @@ def evaluate_transform(rst_path, gold_qud_path, transformed_path, result_filenam
         Path of the file to write the evaluation results to.
     relations_filename : str
         Path to the file to write the results for the relations to.
+    jobs : int
+        Number of processes evaluating the RST trees in parallel.
+        The files written are the same for any number of processes.
     """
 
     def get_code(qud_name):
@@ -52,6 +78,18 @@ def evaluate_transform(rst_path, gold_qud_path, transformed_path, result_filenam
         path = os.path.join(rst_path, filename)
         return path
 
+    def get_transformed_filename(code):
+        transformed_filename = code + ".txt"
+        return os.path.join(transformed_path, transformed_filename)
+
+    def get_gold_filenames(code):
+        curr_gold_filenames = []
+        for name in gold_filenames:
+            match = re.search(code, name)
+            if match:
+                curr_gold_filenames.append(name)
+        return curr_gold_filenames
+
     with open(result_filename, "w") as result_file:
         header = "file code | RST filename | kappa | depth of transformed tree | depth of gold tree | difference between gold_depth and transformed_depth\n"
         result_file.write(header)
@@ -61,80 +99,235 @@ def evaluate_transform(rst_path, gold_qud_path, transformed_path, result_filenam
 
     gold_filenames = os.listdir(gold_qud_path)
 
-    codes = list(set(map(get_code, gold_filenames)))
+    #sorted, so that the results are written in the same order in every run
+    codes = sorted(set(map(get_code, gold_filenames)))
 
     rst_file_paths = list(map(get_rst_path, codes))
 
+    if jobs > 1:
+        tasks = [(code, path, get_transformed_filename(code), gold_qud_path, get_gold_filenames(code))
+                 for code, path in zip(codes, rst_file_paths)]
+        code_results = _evaluate_in_processes(tasks, jobs)
+    else:
+        code_results = _evaluate_in_pipeline(codes, rst_file_paths, get_transformed_filename,
+                                             gold_qud_path, get_gold_filenames)
+
     relations_total = col.defaultdict(float)
     relations_spans = col.defaultdict(float)
 
-    for rst_path, code in zip(rst_file_paths, codes):
-        try:
-            rst_tree = rr.read_rst_from_microtexts(rst_path)
-        except Exception as ex:
-            with open("error_log", "a") as error_file:
-                error_file.write(code)
-                error_file.write("\n")
-                error_file.write(str(ex))
-                error_file.write("\n")
+    #results are merged in the order of the codes, whichever process computed them
+    for code_result in code_results:
+        write_code_result(code_result, result_filename, relations_filename, relations_total, relations_spans)
+
+
+def _evaluate_in_pipeline(codes, rst_file_paths, get_transformed_filename, gold_qud_path, get_gold_filenames):
+    """Yield the Code_Results of the codes, transforming the trees in this process."""
+    codes_by_path = dict(zip(rst_file_paths, codes))
+
+    def get_output_filename(path):
+        return get_transformed_filename(codes_by_path[path])
+
+    #the trees are read, transformed and written in the background, one code after another
+    for result in pipeline.transform_corpus(rst_file_paths, get_output_filename):
+        code = codes_by_path[result.path]
+
+        if not result.error is None:
+            yield Code_Result(code, str(result.error), [], [], None)
             continue
-            
-        qud_transformed = tr.transform_rst(rst_tree)
 
-        transformed_filename = code + ".txt"
-        transformed_filename = os.path.join(transformed_path, transformed_filename)
+        yield evaluate_gold_trees(code, result.qud_tree, gold_qud_path, get_gold_filenames(code))
 
-        qud_transformed.write_tree(transformed_filename)
 
+def _evaluate_in_processes(tasks, jobs):
+    """Yield the Code_Results of the tasks in their order, evaluating them in a pool of processes."""
+    #spawn, since the JVM of a parent process doesn't survive a fork
+    context = mp.get_context("spawn")
+    #spawned processes start from fresh modules, so the settings of this process are passed on
+    pool = context.Pool(jobs, initializer=_init_worker, initargs=(_get_worker_settings(),))
+    try:
+        for code_result in pool.imap(_evaluate_code, tasks):
+            yield code_result
+    except BaseException:
+        pool.terminate()
+        raise
 
-        curr_gold_filenames = []
-        for name in gold_filenames:
-            match = re.search(code, name)
-            if match:
-                curr_gold_filenames.append(name)
+    #let the processes exit on their own instead of terminating them,
+    #so that they save the parse cache and the conjugation cache at exit
+    pool.close()
+    pool.join()
 
-        for name in curr_gold_filenames:
-            try:
-                gold_path = os.path.join(gold_qud_path, name)
-                gold_qud = rq.read_qud_from_microtexts(gold_path)
 
-                kappa, curr_rel_total, curr_rel_spans = calculate_kappa(qud_transformed, gold_qud)
+def _get_worker_settings():
+    """
+    Collect the settings of this process that change the transformed trees.
 
+    A parse pool set with extract_question_content.set_pool can't be shared,
+    the processes parse on their own then.
+    The functions of the backend are pickled by name, so they have to be importable.
+    """
+    backend = eqc.default_backend
+    return {"backend" : (backend, eqc.get_backend(backend)),
+            "model" : parser_manager.default_model,
+            "budgets" : (eqc.max_tokens, eqc.max_parse_time),
+            "server_address" : eqc._server_address,
+            "extraction_patterns" : list(tregex_patterns.extraction_patterns),
+            "chunk_grammar" : rules_extractor.chunk_grammar,
+            "parse_cache" : (parse_cache.cache_filename, parse_cache.persistent),
+            "conjugation" : (conjugation.table_filename, conjugation.persistent, conjugation.use_pattern)}
+
+
+def _init_worker(settings):
+    """Apply the settings collected by _get_worker_settings in a process of _evaluate_in_processes."""
+    backend, functions = settings["backend"]
+    eqc.register_backend(backend, *functions)
+    eqc.set_default_backend(backend)
+    parser_manager.set_default_model(settings["model"])
+    eqc.set_budgets(*settings["budgets"])
+    eqc.set_server(settings["server_address"])
+    tregex_patterns.set_extraction_patterns(settings["extraction_patterns"])
+    rules_extractor.chunk_grammar = settings["chunk_grammar"]
+    parse_cache.cache_filename, parse_cache.persistent = settings["parse_cache"]
+    conjugation.table_filename, conjugation.persistent, conjugation.use_pattern = settings["conjugation"]
+
+
+def _evaluate_code(task):
+    """
+    Read, transform and write one RST tree and compare it to its gold trees.
+    Run by the processes of _evaluate_in_processes.
+
+    Parameter
+    ---------
+    task : (str, str, str, str, [str])
+        code, path of the RST tree, filename to write the transformed tree to,
+        path of the gold trees and filenames of the gold trees of the code
+
+    Return
+    ------
+    code_result : Code_Result
+        result of the evaluation
+    """
+    code, rst_file_path, transformed_filename, gold_qud_path, curr_gold_filenames = task
+
+    try:
+        rst_tree = rr.read_rst_from_microtexts(rst_file_path)
+    except Exception as ex:
+        return Code_Result(code, str(ex), [], [], None)
+
+    qud_transformed = tr.transform_rst(rst_tree)
+    qud_transformed.write_tree(transformed_filename)
+
+    return evaluate_gold_trees(code, qud_transformed, gold_qud_path, curr_gold_filenames)
+
+
+def evaluate_gold_trees(code, qud_transformed, gold_qud_path, curr_gold_filenames):
+    """
+    Compare a transformed tree to the gold trees of its code.
 
-                for key in curr_rel_total.keys():
-                    relations_total[key] += curr_rel_total[key]
-                    relations_spans[key] += curr_rel_spans[key]
+    Parameters
+    ----------
+    code : str
+        file code of the transformed tree
+    qud_transformed : Qud_Node
+        transformed tree
+    gold_qud_path : str
+        Path of the folder containing the human-annotated QUD trees.
+    curr_gold_filenames : [str]
+        filenames of the gold trees for code
 
+    Return
+    ------
+    code_result : Code_Result
+        result of the comparisons
+    """
+    results = []
+    errors = []
 
-                transformed_depth = qud_transformed.get_depth()
-                gold_depth = gold_qud.get_depth()
-                depth_diff = transformed_depth - gold_depth
+    #gold trees, or the exceptions raised while reading them
+    gold_quds = []
+    for name in curr_gold_filenames:
+        try:
+            gold_path = os.path.join(gold_qud_path, name)
+            gold_quds.append(rq.read_qud_from_microtexts(gold_path))
+        except Exception as ex:
+            gold_quds.append(ex)
 
-                with open(result_filename, "a") as result_file:
-                    line = code + " | " + name + " | " + str(kappa) + " | " + str(transformed_depth) + " | " + str(gold_depth) + " | " + str(depth_diff) + "\n"
-                    result_file.write(line)
-            except Exception as ex:
-                if str(ex) == "float division by zero":
-                    raise ex
-                #write errors to file in order to be able to deal with them by hand
-                with open("error_log", "a") as error_file:
-                    error_file.write(name)
-                    error_file.write("\n")
-                    error_file.write(str(ex))
-                    error_file.write("\n")
+    #the transformed tree is prepared once for all gold trees
+    read_gold_quds = [gold_qud for gold_qud in gold_quds if not isinstance(gold_qud, Exception)]
+    kappa_results = iter(calculate_kappas(qud_transformed, read_gold_quds))
 
-        with open(relations_filename, "a") as rel_file:
-            for rel in relations_total.keys():
-                percentage = relations_spans[rel] / relations_total[rel]
-                line = str(rel) + " | " + str(relations_total[rel]) + " | " + str(relations_spans[rel]) + " | " + str(percentage) + "\n"
-                rel_file.write(line)
+    for name, gold_qud in zip(curr_gold_filenames, gold_quds):
+        try:
+            if isinstance(gold_qud, Exception):
+                raise gold_qud
 
+            kappa_result = next(kappa_results)
+            if isinstance(kappa_result, Exception):
+                raise kappa_result
+            kappa, curr_rel_total, curr_rel_spans = kappa_result
 
+            transformed_depth = qud_transformed.get_depth()
+            gold_depth = gold_qud.get_depth()
+            depth_diff = transformed_depth - gold_depth
 
+            line = code + " | " + name + " | " + str(kappa) + " | " + str(transformed_depth) + " | " + str(gold_depth) + " | " + str(depth_diff) + "\n"
+            results.append((line, curr_rel_total, curr_rel_spans))
+        except Exception as ex:
+            if str(ex) == "float division by zero":
+                return Code_Result(code, None, results, errors, ex)
+            errors.append((name, str(ex)))
 
+    return Code_Result(code, None, results, errors, None)
 
 
+def write_code_result(code_result, result_filename, relations_filename, relations_total, relations_spans):
+    """
+    Write the result of one code to the result files and add its relation counts to the totals.
 
+    Parameters
+    ----------
+    code_result : Code_Result
+        result to write
+    result_filename : str
+        Path of the file to write the evaluation results to.
+    relations_filename : str
+        Path to the file to write the results for the relations to.
+    relations_total : defaultdict(float)
+        number of spans using each relation in the codes written so far, updated
+    relations_spans : defaultdict(float)
+        number of correct spans using each relation in the codes written so far, updated
+    """
+    if not code_result.read_error is None:
+        with open("error_log", "a") as error_file:
+            error_file.write(code_result.code)
+            error_file.write("\n")
+            error_file.write(code_result.read_error)
+            error_file.write("\n")
+        return
+
+    for line, curr_rel_total, curr_rel_spans in code_result.results:
+        for key in curr_rel_total.keys():
+            relations_total[key] += curr_rel_total[key]
+            relations_spans[key] += curr_rel_spans[key]
+
+        with open(result_filename, "a") as result_file:
+            result_file.write(line)
+
+    #write errors to file in order to be able to deal with them by hand
+    for name, message in code_result.errors:
+        with open("error_log", "a") as error_file:
+            error_file.write(name)
+            error_file.write("\n")
+            error_file.write(message)
+            error_file.write("\n")
+
+    if not code_result.failure is None:
+        raise code_result.failure
+
+    with open(relations_filename, "a") as rel_file:
+        for rel in relations_total.keys():
+            percentage = relations_spans[rel] / relations_total[rel]
+            line = str(rel) + " | " + str(relations_total[rel]) + " | " + str(relations_spans[rel]) + " | " + str(percentage) + "\n"
+            rel_file.write(line)
 
 
 def calculate_kappa(tree1, tree2):
@@ -164,53 +357,188 @@ def calculate_kappa(tree1, tree2):
         a question in tree1 such that a question with the same span exists in tree2 
     """
 
+    result = calculate_kappas(tree1, [tree2])[0]
+
+    if isinstance(result, Exception):
+        raise result
+
+    return result
+
+
+def calculate_kappas(tree1, trees2):
+    """
+    Calculate the kappa values comparing one QUD tree to several others, see calculate_kappa.
+
+    The matrix of tree1 is built once for all trees in trees2 with the same segmentation,
+    and the matrices of those trees are compared to it in one batch.
+
+    Parameters
+    ----------
+    tree1 : Qud_Node
+        Tree to be compared to each of trees2, e.g. a transformed tree.
+    trees2 : [Qud_Node]
+        Trees to compare tree1 to, e.g. the gold trees of several annotators.
+
+    Return
+    ------
+    results : list
+        for each tree in trees2, either the tuple (kappa, relations_all, relations_spans) 
+        returned by calculate_kappa or the exception raised while comparing the trees
+    """
+
     edus1 = get_edus(tree1)
-    edus2 = get_edus(tree2)
 
-    boundary_segments = find_boundary_segments(edus1, edus2)
+    results = [None] * len(trees2)
 
-    edus1 = enumerate_edus(edus1, boundary_segments)
-    edus2 = enumerate_edus(edus2, boundary_segments)
+    #numbers of tokens of the EDUs and segments, see count_tokens
+    token_counts = dict()
 
-    
-    matrix1 = build_matrix(tree1, edus1)
-    matrix2 = build_matrix(tree2, edus2)
-    
-    relations_all = col.defaultdict(float)
-    relations_spans = col.defaultdict(float)
-    
-    num_cells = len(matrix1.keys())
+    #enumerated EDUs and matrices of tree1 for each segmentation
+    enumerated_edus1 = dict()
+    matrices1 = dict()
+    #indices in trees2 and matrices of the trees to compare in one batch, for each segmentation
+    batches = col.defaultdict(list)
 
-    num_agreed = 0
-    for key in matrix1.keys():
-        
-        if matrix1[key][0]:
-            rel = matrix1[key][1]
-            relations_all[rel] += 1
-            if matrix2[key][0]:
-                relations_spans[rel] += 1
+    for i, tree2 in enumerate(trees2):
+        try:
+            edus2 = get_edus(tree2)
 
-        if matrix1[key][0] == matrix2[key][0]:
-            num_agreed += 1
+            boundary_segments = find_boundary_segments(edus1, edus2)
+            segmentation = tuple(boundary_segments)
 
-            
+            if not segmentation in enumerated_edus1:
+                enumerated_edus1[segmentation] = enumerate_edus(edus1, boundary_segments, token_counts)
+            enumerated_edus2 = enumerate_edus(edus2, boundary_segments, token_counts)
 
-    observed = num_agreed / num_cells
+            if not segmentation in matrices1:
+                matrices1[segmentation] = build_matrix(tree1, enumerated_edus1[segmentation])
+            matrix1, relation_ids1 = matrices1[segmentation]
+            matrix2, _ = build_matrix(tree2, enumerated_edus2)
+        except Exception as ex:
+            results[i] = ex
+            continue
+
+        if len(matrix2) == len(matrix1):
+            batches[segmentation].append((i, matrix2))
+        else:
+            results[i] = compare_matrices(matrix1, relation_ids1, matrix2[np.newaxis])[0]
+
+    for segmentation, batch in batches.items():
+        matrix1, relation_ids1 = matrices1[segmentation]
+        matrices2 = np.stack([matrix2 for _, matrix2 in batch])
+        batch_results = compare_matrices(matrix1, relation_ids1, matrices2)
+        for (i, _), result in zip(batch, batch_results):
+            results[i] = result
+
+    return results
+
+
+def compare_matrices(matrix1, relation_ids1, matrices2):
+    """
+    Calculate kappa values and relation counts from the matrices built by build_matrix.
+
+    Parameters
+    ----------
+    matrix1 : numpy.ndarray
+        span matrix of the first tree
+    relation_ids1 : numpy.ndarray
+        relation ids of the spans of the first tree
+    matrices2 : numpy.ndarray
+        span matrices of the other trees, all of the same size, stacked along the first axis
+
+    Return
+    ------
+    results : list
+        for each of matrices2, either the tuple (kappa, relations_all, relations_spans) 
+        or the exception raised while calculating kappa
+    """
+
+    num_edus1 = len(matrix1)
+    num_edus2 = matrices2.shape[1]
+    if num_edus2 < num_edus1:
+        #the cell of the first row missing in matrices2
+        return [KeyError((0, num_edus2)) for _ in range(len(matrices2))]
+
+    #only the upper triangle including the diagonal, i.e. pairs (edu1, edu2) with edu1 <= edu2, are cells
+    num_cells = num_edus1 * (num_edus1 + 1) // 2
+    num_cells2 = num_edus2 * (num_edus2 + 1) // 2
+
+    #cells of matrix1 in matrices2, cells of matrices2 beyond those are only used for the expected agreement
+    cells2 = matrices2[:, :num_edus1, :num_edus1]
+
+    #the lower triangles are False in all matrices
+    num_disagreed = np.count_nonzero(cells2 != matrix1, axis=(1, 2))
+    nts2 = np.count_nonzero(matrices2, axis=(1, 2))
+
+    nt1 = int(np.count_nonzero(matrix1))
+    nf1 = num_cells - nt1
+
+    relation_counts = count_relations(relation_ids1[matrix1], cells2[:, matrix1])
 
-    num_true = lambda matrix : len([entry for entry in matrix.items() if entry[1][0]])
-    num_false = lambda matrix : len([entry for entry in matrix.items() if not entry[1][0]])
+    results = []
+    for disagreed, nt2, (relations_all, relations_spans) in zip(num_disagreed, nts2, relation_counts):
+        num_agreed = num_cells - int(disagreed)
+        nt2 = int(nt2)
+        nf2 = num_cells2 - nt2
 
-    nt1 = num_true(matrix1)
-    nt2 = num_true(matrix2)
-    nf1 = num_false(matrix1)
-    nf2 = num_false(matrix2)
+        try:
+            observed = num_agreed / num_cells
+
+            expected = 1/(num_cells * num_cells) * (nt1 * nt2 + nf1 * nf2)
+
+            kappa = (observed - expected) / (1 - expected)
+        except ZeroDivisionError as ex:
+            results.append(ex)
+            continue
 
+        results.append((kappa, relations_all, relations_spans))
 
-    expected = 1/(num_cells * num_cells) * (nt1 * nt2 + nf1 * nf2)
+    return results
 
-    kappa = (observed - expected) / (1 - expected)
 
-    return kappa, relations_all, relations_spans
+def count_relations(relation_ids, found):
+    """
+    Count the spans of each relation and how many of them were found in other trees.
+
+    Parameters
+    ----------
+    relation_ids : numpy.ndarray
+        ids of the relations of the spans (see relations.relation_id), in the order of the cells
+    found : numpy.ndarray
+        booleans telling for each other tree (first axis) and each span (second axis) 
+        if the other tree has the same span
+
+    Return
+    ------
+    relation_counts : [(dict, dict)]
+        for each other tree, a dictionary with relations as keys and the numbers of spans as values
+        and a dictionary with relations as keys and the numbers of spans found in the other tree as values,
+        the relations are in the order they first occur in relation_ids
+    """
+    unique_ids, first_positions, inverse = np.unique(relation_ids, return_index=True, return_inverse=True)
+    num_relations = len(unique_ids)
+
+    totals = np.bincount(inverse, minlength=num_relations)
+    #hits[k, r]: number of spans of the r-th relation found in the k-th other tree
+    one_hot = inverse[:, np.newaxis] == np.arange(num_relations)
+    hits = found.astype(np.int64).dot(one_hot.astype(np.int64))
+
+    order = np.argsort(first_positions, kind="stable")
+    names = [relations.relation_name(int(unique_ids[r])) for r in order]
+
+    relation_counts = []
+    for tree_hits in hits:
+        relations_all = col.defaultdict(float)
+        relations_spans = col.defaultdict(float)
+
+        for rel, r in zip(names, order):
+            relations_all[rel] += int(totals[r])
+            if tree_hits[r] > 0:
+                relations_spans[rel] += int(tree_hits[r])
+
+        relation_counts.append((relations_all, relations_spans))
+
+    return relation_counts
 
 
 def find_boundary_segments(edus1, edus2):
@@ -233,28 +561,46 @@ def find_boundary_segments(edus1, edus2):
     
     
     boundary_segments = []
-    
-    while edus1 != [] and edus2 != []:
-        edu1 = edus1[0].strip()
-        edus1 = edus1[1:]
-        edu2 = edus2[0].strip()
-        edus2 = edus2[1:]
+
+    #positions of the next EDUs to take from edus1 and edus2
+    position1 = 0
+    position2 = 0
+    #rest of an EDU after a boundary from the other list, to be taken before the next EDU, None if there is none
+    pending1 = None
+    pending2 = None
+
+    while (not pending1 is None or position1 < len(edus1)) and (not pending2 is None or position2 < len(edus2)):
+        if pending1 is None:
+            edu1 = edus1[position1].strip()
+            position1 += 1
+        else:
+            edu1 = pending1.strip()
+            pending1 = None
+
+        if pending2 is None:
+            edu2 = edus2[position2].strip()
+            position2 += 1
+        else:
+            edu2 = pending2.strip()
+            pending2 = None
 
         if edu1 == edu2:
             boundary_segments.append(edu1)
         elif edu1.startswith(edu2):
             boundary_segments.append(edu2)
-            edu1 = edu1[len(edu2):]
-            edus1 = [edu1] + edus1
+            pending1 = edu1[len(edu2):]
         else:
             boundary_segments.append(edu1)
-            edu2 = edu2[len(edu1):]
-            edus2 = [edu2] + edus2
+            pending2 = edu2[len(edu1):]
             
 
     #simply append remaining EDUs
-    boundary_segments += edus1
-    boundary_segments += edus2
+    if not pending1 is None:
+        boundary_segments.append(pending1)
+    boundary_segments += edus1[position1:]
+    if not pending2 is None:
+        boundary_segments.append(pending2)
+    boundary_segments += edus2[position2:]
 
     return list(enumerate(boundary_segments))
             
@@ -274,32 +620,35 @@ def build_matrix(tree, edus):
     edus : [([int], str)]
         EDUs annotated with numbers.
 
-    Return
-    ------
-    matrix : dict
-        dict with pairs of ints as keys booleans as value
-        if matrix[(x,y)] == (True, _), there is a qud spanning from edu x to edu y in the tree
-        the second element in the pair is the relation presumably used to 
-        build the QUD spanning x and y
+    Returns
+    -------
+    matrix : numpy.ndarray
+        boolean matrix with a row and a column for each EDU number
+        if matrix[x, y], there is a qud spanning from edu x to edu y in the tree
+        only the upper triangle (x <= y) can be True
+    relation_ids : numpy.ndarray
+        int matrix of the same shape with the ids (see relations.relation_id) of the relations 
+        presumably used to build the QUDs spanning x and y, -1 where there is no QUD or no relation
     """
 
-    matrix = dict()
-
-    #build matrix
     num_edus = edus[-1][0][-1] + 1
-    for i in range(num_edus):
-        for j in range(num_edus):
-            if i <= j:
-                matrix[(i,j)] = (False, None)
-    
-    #fill matrix
+
+    matrix = np.zeros((num_edus, num_edus), dtype=bool)
+    relation_ids = np.full((num_edus, num_edus), -1, dtype=np.int16)
 
     edu_pairs, _, _ = get_spans(tree, edus)
 
+    #if several QUDs have the same span, the last one counts
+    span_relations = dict()
     for edu1, edu2, rel in edu_pairs:
-        matrix[(edu1, edu2)] = (True, rel)
+        span_relations[(edu1, edu2)] = rel
+
+    if span_relations:
+        rows, columns = zip(*span_relations.keys())
+        matrix[rows, columns] = True
+        relation_ids[rows, columns] = [relations.relation_id(rel) for rel in span_relations.values()]
 
-    return matrix
+    return matrix, relation_ids
 
 
 def get_spans(tree, edus, right_num=-1):
@@ -319,6 +668,7 @@ def get_spans(tree, edus, right_num=-1):
     ------
     spans : [(int, int, relation)]
         list of spans with relations that were used to form the QUD during transformation
+        relation is taken from the QUD node if it was recorded there, otherwise it is found with find_relation
         relation is None if it can't be determined 
         (which should usually be the case when the tree wasn't transformed from an RST tree)
     edus : [([int], str)]
@@ -328,40 +678,49 @@ def get_spans(tree, edus, right_num=-1):
     """
 
     spans = []
-    leftmost_edu = edus[0]
+    #nodes whose subtrees haven't been left yet, with the leftmost EDU of their span
+    open_nodes = []
+    position = 0
+
+    def close_node():
+        node, _, left = open_nodes.pop()
+        if node.relation is None:
+            relation = find_relation(node.qud)
+        else:
+            #recorded by transform_rst, so the QUD doesn't have to be computed
+            relation = node.relation
+        spans.append((left, right_num, relation))
 
-    if tree.children == []:
-        right_num = edus[0][0][-1]
-        edus = edus[1:]
-        return spans, edus, right_num
+    for node, depth, _, _ in tree.iter_preorder():
+        while open_nodes and open_nodes[-1][1] >= depth:
+            close_node()
 
-    left = None
-    if not tree.edu is None:
-        #If there is an explicit QUD, it's the leftmost edu in the span.
-        left = edus[0][0][0]
-        right_num = edus[0][0][-1]
-        edus = edus[1:]
+        if node.is_leaf():
+            right_num = edus[position][0][-1]
+            position += 1
+            continue
 
-    for child in tree.children:
-        new_spans, edus, right_num = get_spans(child, edus, right_num)
-        spans += new_spans
+        left = edus[position][0][0]
+        if not node.edu is None:
+            #If there is an explicit QUD, it's the leftmost edu in the span.
+            right_num = edus[position][0][-1]
+            position += 1
 
-    if left is None:
-        left = leftmost_edu[0][0]
-    right = right_num
+        open_nodes.append((node, depth, left))
 
-    relation = find_relation(tree.qud)
-    
-    spans.append((left,right, relation))
+    while open_nodes:
+        close_node()
 
-    return spans, edus, right_num
+    return spans, edus[position:], right_num
 
 
 def find_relation(qud):
     """
     Find relation from which a QUD was produced.
 
-    Find the relation by matching the question_frames from transform_rst to the QUD.
+    Find the relation by matching the question_frames from transform_rst to the QUD,
+    both parts of a frame have to occur in the QUD.
+    Used for trees read from files, transformed trees record their relations.
     This is a crude method, since sometimes different relations have the same question frames.
     For example, "elaboration", "e-elaboration", and "unstated-relation" will be 
     matched to "elaboration"; 
@@ -378,36 +737,53 @@ def find_relation(qud):
     rel : str
         relation that was identified as being the one used to make the QUD
     """
-    for rel, frame in tr.question_frame_right.items():
-        reg1 = re.escape(frame[0])
-        match1 = re.search(reg1, qud)
+    if not qud in _found_relations:
+        relation = None
+        for rel, part1, part2 in get_frame_table():
+            if part1 in qud and part2 in qud:
+                relation = rel
+                break
+        _found_relations[qud] = relation
 
-        reg2 = re.escape(frame[1])
-        match2 = re.search(reg2, qud)
+    return _found_relations[qud]
 
-        if match1 and match2:
-            return rel
 
-    for rel, frame in tr.question_frame_left.items():
-        reg1 = re.escape(frame[0])
-        match1 = re.search(reg1, qud)
+#relations found by find_relation for each QUD
+_found_relations = dict()
 
-        reg2 = re.escape(frame[1])
-        match2 = re.search(reg2, qud)
+#(relation, part1, part2) for each question frame, built on first use by get_frame_table
+_frame_table = None
 
-        if match1 and match2:
-            return rel
 
-    return None
-        
+def get_frame_table():
+    """
+    Return the question frames from transform_rst in the order find_relation tries them,
+    the frames on the right first.
 
-            
-    
-    
+    Frames with the same parts as an earlier frame are left out, since they can never match first.
+
+    Return
+    ------
+    frame_table : [(str, str, str)]
+        relation and the two parts of its question frame
+    """
+    global _frame_table
+
+    if _frame_table is None:
+        _frame_table = []
+        seen = set()
+        for frames in (tr.question_frame_right, tr.question_frame_left):
+            for rel, frame in frames.items():
+                #frame[0] and frame[1] are single characters if the frame is a single string
+                parts = (frame[0], frame[1])
+                if not parts in seen:
+                    seen.add(parts)
+                    _frame_table.append((rel,) + parts)
 
+    return _frame_table
 
 
-def enumerate_edus(edus1, boundary_segments):
+def enumerate_edus(edus1, boundary_segments, token_counts=None):
     """
     Annotate edus1 with the numbers of the corresponding segments in boundary_segments.
 
@@ -419,6 +795,9 @@ def enumerate_edus(edus1, boundary_segments):
         EDUs to annotate with the numbers.
     boundary_segments : [(int, str)]
         enumerated segments
+    token_counts : dict
+        numbers of tokens of texts already tokenized, see count_tokens, updated
+        Pass the same dict to calls with the same segments to tokenize each text only once.
 
     Return
     ------
@@ -426,19 +805,25 @@ def enumerate_edus(edus1, boundary_segments):
         edus1 annotated with the edu numbers
     """
 
+    if token_counts is None:
+        token_counts = dict()
+
     ret_edus = []
 
+    #position of the next segment
+    position = 0
+
     for combined_edu in edus1:
-        combined_list = word_tokenize(combined_edu.strip(",. ").lower())
-        num, edu = boundary_segments[0]
-        boundary_segments = boundary_segments[1:]
-        single_list = word_tokenize(edu.strip(",. ").lower())
+        combined_length = count_tokens(combined_edu, True, token_counts)
+        num, edu = boundary_segments[position]
+        position += 1
+        single_length = count_tokens(edu, True, token_counts)
         num_list = [num]
         
-        while len(combined_list) > len(single_list):
-            num, edu = boundary_segments[0]
-            boundary_segments = boundary_segments[1:]
-            single_list += word_tokenize(edu)
+        while combined_length > single_length:
+            num, edu = boundary_segments[position]
+            position += 1
+            single_length += count_tokens(edu, False, token_counts)
             num_list.append(num)
 
         ret_edus.append((num_list, combined_edu))
@@ -446,6 +831,34 @@ def enumerate_edus(edus1, boundary_segments):
     return ret_edus
 
 
+def count_tokens(text, normalize, token_counts):
+    """
+    Count the tokens of a text.
+
+    Parameters
+    ----------
+    text : str
+        text to tokenize
+    normalize : Boolean
+        if True, strip commas, full stops and spaces and lowercase text before tokenizing it
+    token_counts : dict
+        numbers of tokens by (text, normalize) of the texts already tokenized, updated
+
+    Return
+    ------
+    num_tokens : int
+        number of tokens
+    """
+    key = (text, normalize)
+
+    if not key in token_counts:
+        if normalize:
+            text = text.strip(",. ").lower()
+        token_counts[key] = len(nltk.word_tokenize(text))
+
+    return token_counts[key]
+
+
 
 
 
@@ -466,15 +879,4 @@ def get_edus(tree):
         EDUs of the tree.
     """
 
-    edus = []
-
-    if not tree.edu is None:
-        edus.append(tree.edu)
-
-    for child in tree.children:
-        edus += get_edus(child)
-
-    return edus
-
-
-
+    return [node.edu for node, _, _, _ in tree.iter_preorder() if not node.edu is None]
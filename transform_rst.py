@@ -1,120 +1,168 @@
-import copy
-
 import rst_tree
 import relations
 import extract_question_content as eqc
 import qud_tree
 
-def transform_rst(rst_tree):
+#kinds of tasks of transform
+_EXPAND = 0
+_EMIT = 1
+_RESTATE = 2
+
+def transform_rst(rst_tree, backend=None):
     """wrapper function for transform()"""
-    return transform(rst_tree)[0]
+    return transform(rst_tree, backend=backend)[0]
 
-def transform(rst_node, root=True):
-    """
-    Transform an rst tree recursively into a qud tree.
 
-    Parameter
-    ---------
-    rst_node : Rst_Node
-        tree to be transformed
-    root : Boolean
-        indicates if this node is the root of the overall tree
-
-    Returns
-    -------
-    qud_nodes : [Qud_Node]
-        transformed tree
+class Qud_Renderer:
     """
+    Computes the QUDs of the nodes created by one call of transform, when they are first read.
 
-    if root:
-        qud_node = qud_tree.Qud_Node(qud="What is the way things are?")
-        for child in transform(rst_node, root=False):
-            qud_node.add_child(child)
-
-        return [qud_node]
-
-
-
-
-    if len(rst_node.satellites_left) > 0:
-        sats = rst_node.satellites_left
-        sat, rel = sats[(len(sats)-1)]
-        rst_node_copy = copy.copy(rst_node)
-        rst_node_copy.satellites_left = sats[:len(sats)-1]
-
-        qud = find_qud(rel, sat, right = False)
-        qud_node = qud_tree.Qud_Node(qud=qud)
-
-
-        sat_children = transform(sat, root=False)
-
-        nuc_children = transform(rst_node_copy, root=False)
-        for child in nuc_children:
-            qud_node.add_child(child)
-
-        return sat_children + [qud_node]
+    Nothing is parsed as long as only the structure of the QUD tree is used.
+    The first QUD that is read parses all EDUs of the rst tree at once.
 
-    if len(rst_node.satellites_right) > 0:
-        sats = rst_node.satellites_right
-
-        sat, rel = sats[(len(sats)-1)]
-
-        rst_node_copy = copy.copy(rst_node)
-        rst_node_copy.satellites_right = sats[:len(sats)-1]
+    Attributes
+    ----------
+    rst_tree : Rst_Node
+        transformed rst tree
+    backend : String
+        name of the question content extractor to use,
+        extract_question_content.default_backend if None
+    memo : dict
+        question contents of the subtrees, see find_qud
+    """
 
-        qud = find_qud(rel, rst_node_copy, right = True)
+    def __init__(self, rst_node, backend=None):
+        self.rst_tree = rst_node
+        self.backend = backend
+        self.memo = dict()
+        self._prefetched = False
 
-        qud_node = qud_tree.Qud_Node(qud=qud)
+    def __call__(self, qud_node):
+        if not self._prefetched:
+            #parse all EDUs at once before the QUDs ask for them one by one
+            eqc.prefetch(self.rst_tree, backend=self.backend)
+            self._prefetched = True
 
-        nuc_children = transform(rst_node_copy, root=False)
+        right = qud_node.side == rst_tree.SIDE_RIGHT
+        return find_qud(qud_node.relation, qud_node.subtree, right, backend=self.backend, memo=self.memo)
 
-        sat_children = transform(sat, root=False)
 
-        for child in sat_children:
-            qud_node.add_child(child)
+def _expand(rst_node, target):
+    """Return the task to transform rst_node with all its satellites and append the result to target."""
+    return (_EXPAND, rst_node, len(rst_node.get_satellites(rst_tree.SIDE_LEFT)),
+            len(rst_node.get_satellites(rst_tree.SIDE_RIGHT)), target)
 
-        return nuc_children + [qud_node]
+def transform(rst_node, root=True, backend=None):
+    """
+    Transform an rst tree into a qud tree.
 
-    children, multi_nuc_type = rst_node.children
+    Satellites are peeled off one after another, the last left satellite first,
+    then the last right satellite. Instead of copying the nucleus for every satellite,
+    a task refers to the nucleus and the number of its satellites still attached.
 
-    if multi_nuc_type is None and children != []:
-        #span node
-        return transform(children[0], root=False)
+    Parameter
+    ---------
+    rst_node : Rst_Node
+        tree to be transformed
+    root : Boolean
+        indicates if this node is the root of the overall tree
+    backend : String
+        name of the question content extractor to use,
+        extract_question_content.default_backend if None
 
-    if multi_nuc_type is None and children == []:
-        #leaf
-        edu = rst_node.edu
+    Returns
+    -------
+    qud_nodes : [Qud_Node]
+        transformed tree, the QUDs are computed when they are first read (see Qud_Renderer)
+    """
 
-        qud_node = qud_tree.Qud_Node(edu=edu)
+    transformed = []
 
-        return [qud_node]
+    #the QUDs are computed when they are read
+    render = Qud_Renderer(rst_node, backend=backend)
 
-    
-    if multi_nuc_type != "restatement_mn":
-        #it's a multi-nuc, not a span
-        transformed = []
-        for child in children:
-            for element in transform(child, root=False):
-                transformed.append(element)
-
-        return transformed
+    if root:
+        qud_node = qud_tree.Qud_Node(qud="What is the way things are?")
+        transformed.append(qud_node)
+        target = qud_node.children
     else:
-        transformed = []
-
-        transformed.append(transform(children[0], root=False))
-
-        for i, child in enumerate(children[1:]):
-            qud = find_qud("restatement", children[i], right=True)
-
-            qud_node = qud_tree.Qud_Node(qud=qud)
-            qud_node.children += transform(child, root=False)
-
-            transformed.append(qud_node)
-
-        return transformed
+        target = transformed
+
+    #tasks are taken from the end, so the tasks for the parts of a node are pushed in reverse order
+    #(_EXPAND, rst_node, num_left, num_right, target): transform rst_node with only its first num_left
+    #left satellites and num_right right satellites attached, and append the qud nodes to target
+    #(_EMIT, qud_node, target): append qud_node to target, once its children are done
+    #(_RESTATE, previous, rst_node, target): transform rst_node as restatement of previous
+    tasks = [_expand(rst_node, target)]
+
+    while tasks:
+        task = tasks.pop()
+
+        if task[0] == _EMIT:
+            _, qud_node, target = task
+            target.append(qud_node)
+            continue
+
+        if task[0] == _RESTATE:
+            _, previous, rst_node, target = task
+            qud_node = qud_tree.Qud_Node(relation="restatement", side=rst_tree.SIDE_RIGHT, subtree=previous,
+                                         source_ids=(previous.node_id, rst_node.node_id), render=render)
+            tasks.append((_EMIT, qud_node, target))
+            tasks.append(_expand(rst_node, qud_node.children))
+            continue
+
+        _, rst_node, num_left, num_right, target = task
+
+        if num_left > 0:
+            sat, rel = rst_node.get_satellites(rst_tree.SIDE_LEFT)[num_left-1]
+
+            qud_node = qud_tree.Qud_Node(relation=rel, side=rst_tree.SIDE_LEFT, subtree=sat,
+                                         source_ids=(rst_node.node_id, sat.node_id), render=render)
+
+            #satellite first, then the nucleus with the remaining satellites below the qud node
+            tasks.append((_EMIT, qud_node, target))
+            tasks.append((_EXPAND, rst_node, num_left-1, num_right, qud_node.children))
+            tasks.append(_expand(sat, target))
+            continue
+
+        if num_right > 0:
+            sat, rel = rst_node.get_satellites(rst_tree.SIDE_RIGHT)[num_right-1]
+
+            #the question content doesn't depend on the satellites of the nucleus
+            qud_node = qud_tree.Qud_Node(relation=rel, side=rst_tree.SIDE_RIGHT, subtree=rst_node,
+                                         source_ids=(rst_node.node_id, sat.node_id), render=render)
+
+            #nucleus with the remaining satellites first, then the satellite below the qud node
+            tasks.append((_EMIT, qud_node, target))
+            tasks.append(_expand(sat, qud_node.children))
+            tasks.append((_EXPAND, rst_node, 0, num_right-1, target))
+            continue
+
+        children, multi_nuc_type = rst_node.children
+
+        if multi_nuc_type is None and children != []:
+            #span node
+            tasks.append(_expand(children[0], target))
+            continue
+
+        if multi_nuc_type is None and children == []:
+            #leaf
+            target.append(qud_tree.Qud_Node(edu=rst_node.edu, source_ids=(rst_node.node_id,)))
+            continue
+
+        if multi_nuc_type != "restatement_mn":
+            #it's a multi-nuc, not a span
+            for child in reversed(children):
+                tasks.append(_expand(child, target))
+        else:
+            for i in range(len(children)-1, 0, -1):
+                tasks.append((_RESTATE, children[i-1], children[i], target))
+            tasks.append(_expand(children[0], target))
+
+    return transformed
 
             
-def find_qud(relation, subtree, right):
+def find_qud(relation, subtree, right, backend=None, memo=None):
     """
     Find QUD of a certain node from the relation and the subtree to the left of the node.
 
@@ -126,6 +174,13 @@ def find_qud(relation, subtree, right):
         Left-hand subtree in the relation, either nucleus or satellite.
     right : Boolean
         Is true if satellite is to the right of the nucleus in the relation.
+    backend : String
+        name of the question content extractor to use,
+        extract_question_content.default_backend if None
+    memo : dict
+        maps pairs of a node found by extract_question_content.resolve_span and gerund
+        to that variant of its question content, filled on first use, so that a span node
+        and its nucleus share entries; the question content is extracted on every call if None
     """
 
     if right:
@@ -133,7 +188,20 @@ def find_qud(relation, subtree, right):
     else:
         use_gerund = relation in use_gerund_relations_left
 
-    question_content = eqc.find_question_content(subtree, gerund=use_gerund)
+    if memo is None:
+        question_content = eqc.find_question_content(subtree, gerund=use_gerund, backend=backend)
+    else:
+        node = eqc.resolve_span(subtree)
+        #spans use the gerund variant of their nucleus, see find_question_content
+        key = (node, use_gerund or not node is subtree)
+        if not key in memo:
+            _, _, extract_both = eqc.get_backend(backend)
+            if extract_both is None:
+                #extract only the variant that is needed
+                memo[key] = eqc.find_question_content(node, gerund=key[1], backend=backend)
+            else:
+                memo[(node, True)], memo[(node, False)] = eqc.find_question_contents(node, backend=backend)
+        question_content = memo[key]
 
     if right:
         part1 = question_frame_right[relation][0]
@@ -0,0 +1,77 @@
+"""
+Registry of precompiled Tregex patterns.
+
+Compiling a pattern crosses the Python/Java bridge, so each pattern string
+is compiled once per JVM and the compiled pattern is reused afterwards.
+"""
+
+import lazy_import
+import parser_manager
+
+#imported on first use, see lazy_import.py
+jpype = lazy_import.lazy_module("jpype")
+
+
+#patterns tried in order by extract_question_content.extract_from_single
+#each pattern has to name a noun phrase "nounp" and a verb phrase "verbp"
+extraction_patterns = ["NP=nounp .. VP=verbp"]
+
+#pattern used to find the subject in the noun phrase
+SUBJECT_PATTERN = "NP"
+
+_compiled = {}
+
+
+def get_pattern(pattern_string):
+    """
+    Return the compiled Tregex pattern for a pattern string, compiling it on first use.
+
+    Parameter
+    ---------
+    pattern_string : String
+        Tregex pattern
+
+    Return
+    ------
+    pattern : TregexPattern
+        compiled pattern
+    """
+    if not pattern_string in _compiled:
+        parser_manager.start_jvm()
+        TregexPattern = jpype.JPackage("edu").stanford.nlp.trees.tregex.TregexPattern
+        _compiled[pattern_string] = TregexPattern.compile(pattern_string)
+
+    return _compiled[pattern_string]
+
+
+def get_extraction_patterns():
+    """Return the compiled extraction patterns in the order they are to be tried."""
+    return [get_pattern(pattern_string) for pattern_string in extraction_patterns]
+
+
+def add_extraction_pattern(pattern_string, position=None):
+    """
+    Add a pattern to the extraction patterns.
+
+    Parameters
+    ----------
+    pattern_string : String
+        Tregex pattern naming a noun phrase "nounp" and a verb phrase "verbp"
+    position : int
+        position in the list of patterns, the pattern is appended if None
+    """
+    if position is None:
+        extraction_patterns.append(pattern_string)
+    else:
+        extraction_patterns.insert(position, pattern_string)
+
+
+def set_extraction_patterns(pattern_strings):
+    """Replace the extraction patterns by a list of Tregex patterns."""
+    extraction_patterns[:] = pattern_strings
+
+
+def compile_all():
+    """Compile all registered patterns ahead of the first extraction."""
+    get_extraction_patterns()
+    get_pattern(SUBJECT_PATTERN)